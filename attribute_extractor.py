@@ -0,0 +1,223 @@
+"""Extract storage, color, condition, model and other attributes from titles.
+
+The vocabulary maps each category to (canonical value, patterns) pairs.
+AttributeExtractor compiles every pattern of the categories it needs into
+one regular expression and reads all attributes in a single scan of the
+title. Within a category the earliest match wins, except for categories
+listed in RANKED_CATEGORIES, where the value listed first in the
+vocabulary wins (so "parts only" beats "new battery"). Phrases that only
+look like attributes, such as eBay's "New Listing" badge, are skipped.
+
+extract_series() does the same over a whole pandas Series, scanning each
+distinct title once, for re-tagging large histories.
+"""
+import re
+from functools import lru_cache
+
+# A pattern only matches as a whole word (digits may run into units, as in
+# "64GB"). eBay glues its "New Listing" badge onto the title ("New
+# ListingApple ..."), so a word may also start straight after "Listing".
+_WORD_START = r'(?:(?<![A-Za-z0-9])|(?<=listing))'
+_WORD_END = r'(?![A-Za-z])'
+
+# Text that looks like an attribute but is not one
+NOISE_PATTERNS = [
+    r'new\s*listing',
+]
+
+# canonical value None means "normalize the matched text" (see FORMATTERS)
+DEFAULT_VOCABULARY = {
+    'condition': [
+        ('For Parts or Not Working', [r'for\s+parts(?:\s+or\s+not\s+working)?', r'parts\s+only', r'not\s+working',
+                                      r'broken', r'cracked\s+screen', r'as[\s-]is', r'icloud\s+locked']),
+        ('Certified Refurbished', [r'certified\s+refurbished', r'apple\s+refurbished']),
+        ('Seller Refurbished', [r'seller\s+refurbished', r'refurbished', r'renewed']),
+        ('Open Box', [r'open\s+box(?:ed)?']),
+        ('Pre-owned', [r'pre[\s-]?owned', r'like\s+new', r'used', r'(?:very\s+good|excellent|good|fair)\s+condition',
+                       r'grade\s+[abc]']),
+        ('New', [r'brand\s+new', r'new\s+(?:in|sealed)\s+box', r'factory\s+sealed', r'sealed', r'new']),
+    ],
+    'ram': [
+        (None, [r'\d+\s*GB\s*(?:of\s+)?(?:RAM|memory|unified\s+memory|(?:LP)?DDR\d\w*)']),
+    ],
+    'storage': [
+        (None, [r'\d+(?:\.\d+)?\s*(?:GB|TB)(?!\s*(?:of\s+)?(?:RAM|memory|unified|(?:LP)?DDR))']),
+    ],
+    'color': [
+        ('Rose Gold', [r'rose\s+gold']),
+        ('Gray', [r'space\s+gr[ae]y', r'gr[ae]y', r'graphite']),
+        ('Black', [r'black', r'midnight(?!\s+(?:green|blue))', r'obsidian']),
+        ('White', [r'white', r'starlight']),
+        ('Silver', [r'silver']),
+        ('Gold', [r'gold']),
+        ('Blue', [r'(?:sierra|pacific|alpine|midnight)\s+blue', r'blue']),
+        ('Red', [r'\(product\)\s*red', r'red']),
+        ('Green', [r'(?:alpine|midnight)\s+green', r'green']),
+        ('Purple', [r'deep\s+purple', r'purple', r'lavender']),
+        ('Pink', [r'pink']),
+        ('Yellow', [r'yellow']),
+        ('Titanium', [r'(?:natural|black|white|blue|desert)\s+titanium', r'titanium']),
+    ],
+    'processor': [
+        (None, [r'(?:intel\s+)?core\s+i[3579](?:[\s-]\d{4,5}\w*)?', r'apple\s+m[1-4](?:\s+(?:pro|max|ultra))?',
+                r'm[1-4]\s+(?:pro|max|ultra)', r'm[1-4]\s+chip', r'(?:amd\s+)?ryzen\s+[3579](?:\s+\d{4}\w*)?',
+                r'celeron', r'pentium']),
+    ],
+    'resolution': [
+        (None, [r'\d+(?:\.\d+)?\s*MP', r'\d+(?:\.\d+)?\s*mega\s*pixels?']),
+    ],
+    'type': [
+        ('DSLR', [r'dslr']),
+        ('Mirrorless', [r'mirrorless']),
+        ('Point & Shoot', [r'point\s*(?:&|and)\s*shoot', r'compact\s+camera']),
+        ('Action Camera', [r'action\s+cam(?:era)?', r'gopro']),
+        ('Film', [r'film\s+camera', r'35\s*mm\s+film']),
+    ],
+    'model': [
+        (None, [
+            r'iphone\s*(?:\d{1,2}|x[sr]?|se)(?:\s*(?:pro\s*max|pro|plus|max|mini))?',
+            r'ipad(?:\s*(?:pro|air|mini))?(?:\s*\d{1,2}(?:\.\d)?(?:th|rd|nd|st)?\s*gen(?:eration)?)?',
+            r'galaxy\s*(?:s|note|a|z\s*fold|z\s*flip)\s*\d{1,2}(?:\s*(?:ultra|plus|\+|fe))?',
+            r'galaxy\s*(?:watch|tab)\s*\w{1,3}',
+            r'pixel\s*\d{1,2}a?(?:\s*(?:pro\s*xl|pro|xl))?',
+            r'apple\s+watch(?:\s+(?:series\s*\d{1,2}|ultra\s*\d?|se))?',
+            r'macbook\s*(?:air|pro)?',
+            r'thinkpad\s*[a-z]\d{1,3}\w*',
+            r'xps\s*\d{2}',
+        ]),
+    ],
+}
+
+# Categories where vocabulary order decides between several matches
+RANKED_CATEGORIES = ('condition',)
+
+# Categories extracted for each device type (as in get_device_filters), plus model
+DEVICE_CATEGORIES = {
+    'phone': ['storage', 'color', 'condition', 'model'],
+    'laptop': ['processor', 'ram', 'storage', 'condition', 'model'],
+    'tablet': ['storage', 'color', 'condition', 'model'],
+    'smartwatch': ['color', 'condition', 'model'],
+    'camera': ['type', 'resolution', 'condition', 'model'],
+}
+# Device types are free text ("iphone 14"), so anything else gets the general set
+DEFAULT_CATEGORIES = ['storage', 'color', 'condition', 'model']
+
+_SIZE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(GB|TB|MP|mega\s*pixels?)', re.IGNORECASE)
+_SPACES_RE = re.compile(r'\s+')
+
+# Words whose casing title() gets wrong
+_MODEL_WORDS = {
+    'iphone': 'iPhone', 'ipad': 'iPad', 'macbook': 'MacBook', 'thinkpad': 'ThinkPad', 'xps': 'XPS',
+    'se': 'SE', 'xs': 'XS', 'xr': 'XR', 'x': 'X', 'fe': 'FE', 'xl': 'XL', 'amd': 'AMD',
+}
+
+
+def _format_size(text):
+    size_match = _SIZE_RE.search(text)
+    if not size_match:
+        return text.strip()
+    unit = size_match.group(2).upper()
+    return f"{size_match.group(1)}{'MP' if unit.startswith('MEGA') else unit}"
+
+
+def _format_word(word):
+    if word in _MODEL_WORDS:
+        return _MODEL_WORDS[word]
+    if re.fullmatch(r'\d+(?:st|nd|rd|th)', word):
+        return word
+    if re.match(r'i\d', word):
+        # Intel model numbers: "i7-1165g7" -> "i7-1165G7"
+        return word[:1] + word[1:].upper()
+    if any(char.isdigit() for char in word):
+        return word.upper()
+    return word[:1].upper() + word[1:]
+
+
+def _format_name(text):
+    text = _SPACES_RE.sub(' ', text.strip().lower())
+    # "iphone14" -> "iphone 14"
+    text = re.sub(r'^(iphone|ipad|pixel)(?=\d)', r'\1 ', text)
+    return ' '.join(_format_word(word) for word in text.split(' '))
+
+
+FORMATTERS = {
+    'storage': _format_size,
+    'ram': _format_size,
+    'resolution': _format_size,
+    'processor': _format_name,
+    'model': _format_name,
+}
+
+
+def _word(pattern):
+    return f"{_WORD_START}(?:{pattern}){_WORD_END}"
+
+
+class AttributeExtractor:
+    """Single-pass attribute extraction for a chosen set of categories"""
+
+    def __init__(self, vocabulary=None, categories=None):
+        vocabulary = vocabulary or DEFAULT_VOCABULARY
+        self.categories = [category for category in (categories or DEFAULT_CATEGORIES) if category in vocabulary]
+        self.vocabulary = {category: vocabulary[category] for category in self.categories}
+
+        # One named group per (category, value); noise first so it is consumed
+        # before anything else. The word-start check is shared by every
+        # alternative, so positions inside words are rejected in one step.
+        self.terms = {}
+        alternatives = []
+        for pattern in NOISE_PATTERNS:
+            name = f"t{len(self.terms)}"
+            self.terms[name] = ('noise', None, 0)
+            alternatives.append(f"(?P<{name}>{pattern})")
+        for category in self.categories:
+            for rank, (canonical, patterns) in enumerate(self.vocabulary[category]):
+                name = f"t{len(self.terms)}"
+                self.terms[name] = (category, canonical, rank)
+                alternatives.append(f"(?P<{name}>(?:{'|'.join(patterns)}){_WORD_END})")
+        self.scanner = re.compile(f"{_WORD_START}(?:{'|'.join(alternatives)})", re.IGNORECASE)
+
+    def _value(self, category, canonical, text):
+        if canonical is not None:
+            return canonical
+        formatter = FORMATTERS.get(category)
+        return formatter(text) if formatter else text.strip()
+
+    def extract(self, title):
+        """Return {category: value} for every category found in title"""
+        if not title:
+            return {}
+        found = {}
+        for match in self.scanner.finditer(title):
+            category, canonical, rank = self.terms[match.lastgroup]
+            if category == 'noise':
+                continue
+            if category in found:
+                # Earliest match wins unless the category is ranked
+                if category not in RANKED_CATEGORIES or rank >= found[category][0]:
+                    continue
+            found[category] = (rank, self._value(category, canonical, match.group()))
+        return {category: found[category][1] for category in self.categories if category in found}
+
+    def extract_series(self, titles):
+        """Extract attributes for a whole pandas Series; returns a DataFrame
+
+        Columns follow self.categories and missing attributes are NaN. Each
+        distinct title is scanned once with extract(), and the rows are
+        expanded back with the factorized codes, so repeated titles (common
+        in histories) cost nothing extra.
+        """
+        import pandas as pd
+
+        codes, uniques = pd.factorize(titles.fillna('').astype(str))
+        extracted = pd.DataFrame.from_records(
+            [self.extract(title) for title in uniques], columns=self.categories, index=range(len(uniques)),
+        )
+        return extracted.take(codes).set_index(titles.index).rename_axis(index=titles.index.name, columns=None)
+
+
+@lru_cache(maxsize=None)
+def for_device(device_type=None):
+    """Shared extractor for a device type such as 'phone' or 'laptop'"""
+    categories = DEVICE_CATEGORIES.get((device_type or '').lower(), DEFAULT_CATEGORIES)
+    return AttributeExtractor(categories=categories)
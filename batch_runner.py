@@ -0,0 +1,232 @@
+"""Run many scrape jobs without prompting.
+
+Jobs come from a JSONL file, one per line:
+
+    {"device_type": "iphone 14 pro", "filters": {"storage": ["128GB"], "condition": ["Pre-owned"]}, "max_items": 500}
+
+Optional keys are "id" (defaults to a hash of the job) and "max_pages".
+Jobs run concurrently over one shared HTTP session pool, browser fallback
+and parser process pool. Each job's status is written to a checkpoint file
+as it changes, so rerunning the same command after a crash only runs the
+jobs that had not finished.
+
+Usage:
+    python batch_runner.py jobs.jsonl --concurrency 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from ebay_scraper import (EbayElectronicsScraper, add_run_arguments, build_fetcher, check_run_arguments,
+                          instrument_run, open_duplicates, open_store)
+from item_index import ItemIndex
+from metrics import METRICS, ThreadProfiles
+from pipeline import process_pool
+from price_stats import PriceStatsStore
+from search_url import DEFAULT_BASE_URL
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def job_id(job):
+    """Stable id for a job, so checkpoints survive reordering the jobs file"""
+    if job.get('id'):
+        return str(job['id'])
+    canonical = json.dumps(
+        {key: job.get(key) for key in ('device_type', 'filters', 'max_items', 'max_pages')},
+        sort_keys=True,
+    )
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def load_jobs(path):
+    """Read and validate the jobs in a JSONL file"""
+    jobs = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if not job.get('device_type'):
+                raise ValueError(f"{path}:{line_number}: job has no device_type")
+            job.setdefault('filters', {})
+            job['id'] = job_id(job)
+            jobs.append(job)
+    return jobs
+
+
+class Checkpoint:
+    """Per-job status kept in a JSON file that is rewritten on every change"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.jobs = json.load(f)
+        except FileNotFoundError:
+            self.jobs = {}
+
+    def status(self, job_id):
+        return self.jobs.get(job_id, {}).get('status', PENDING)
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            entry = self.jobs.setdefault(job_id, {'attempts': 0})
+            entry.update(fields)
+            entry['updated_at'] = datetime.now().isoformat(timespec='seconds')
+            if fields.get('status') == RUNNING:
+                entry['attempts'] += 1
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.jobs, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+class BatchRunner:
+    """Run jobs concurrently over shared fetcher, parser pool and outputs"""
+
+    def __init__(self, fetcher, checkpoint, concurrency=4, page_workers=2, parse_executor=None,
+                 index=None, store=None, price_stats=None, duplicates=None, base_url=DEFAULT_BASE_URL,
+                 price_stats_path=None, profiles=None):
+        self.fetcher = fetcher
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.page_workers = page_workers
+        self.parse_executor = parse_executor
+        self.index = index
+        self.store = store
+        self.price_stats = price_stats
+        self.duplicates = duplicates
+        self.base_url = base_url
+        # Saved after every job, so a crash cannot lose the sales of jobs
+        # that the checkpoint and indexes already record as done
+        self.price_stats_path = price_stats_path
+        self.save_lock = threading.Lock()
+        # ThreadProfiles for --profile: jobs run on pool threads the main thread's profiler cannot see
+        self.profiles = profiles
+
+    def run_job(self, job):
+        with self.profiles.profile() if self.profiles is not None else nullcontext():
+            return self._run_job(job)
+
+    def _run_job(self, job):
+        self.checkpoint.update(job['id'], status=RUNNING, device_type=job['device_type'], error=None)
+        try:
+            # Scrapers are cheap; the expensive parts are the shared fetcher and pools
+            scraper = EbayElectronicsScraper(fetcher=self.fetcher, base_url=self.base_url)
+            df = scraper.scrape_sold_items(
+                job['device_type'],
+                job['filters'],
+                max_pages=job.get('max_pages', 10),
+                max_items=job.get('max_items'),
+                workers=self.page_workers,
+                # Without a shared pool, parse on this job's thread rather than start a pool per job
+                parse_workers=None if self.parse_executor is not None else 0,
+                parse_executor=self.parse_executor,
+                index=self.index,
+                store=self.store,
+                price_stats=self.price_stats,
+                duplicates=self.duplicates,
+                # A failed save must fail the job, not checkpoint it as done with 0 items
+                raise_errors=True,
+            )
+            if self.price_stats is not None and self.price_stats_path:
+                with self.save_lock:
+                    self.price_stats.save(self.price_stats_path)
+        except Exception as e:
+            METRICS.error('job', e)
+            print(f"Job {job['id']} failed: {str(e)}")
+            self.checkpoint.update(job['id'], status=FAILED, error=str(e))
+            return False
+
+        self.checkpoint.update(job['id'], status=DONE, items=len(df))
+        return True
+
+    def run(self, jobs):
+        """Run every job that is not already done; returns (succeeded, failed, skipped)"""
+        todo = [job for job in jobs if self.checkpoint.status(job['id']) != DONE]
+        skipped = len(jobs) - len(todo)
+        if skipped:
+            print(f"Skipping {skipped} jobs already done in {self.checkpoint.path}")
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            outcomes = list(pool.map(self.run_job, todo))
+
+        succeeded = sum(outcomes)
+        return succeeded, len(outcomes) - succeeded, skipped
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run scrape jobs from a JSONL file")
+    parser.add_argument('jobs', help="JSONL file with one {device_type, filters, max_items} job per line")
+    parser.add_argument('--checkpoint',
+                        help="job status file used to resume (default: <jobs>.checkpoint.json)")
+    parser.add_argument('--concurrency', type=int, default=4, help="jobs to run at once")
+    parser.add_argument('--page-workers', type=int, default=2, help="result pages fetched at once per job")
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1,
+                        help="parser processes shared by all jobs (0 parses on the job's thread)")
+    add_run_arguments(parser)
+    args = parser.parse_args(argv)
+    check_run_arguments(parser, args)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = load_jobs(args.jobs)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.jobs}.checkpoint.json")
+
+    fetcher = build_fetcher(args, pool_size=args.concurrency * args.page_workers)
+    index = ItemIndex(args.index) if args.incremental else None
+    store = open_store(args)
+    duplicates = open_duplicates(args)
+    price_stats = PriceStatsStore.load(args.price_stats) if args.price_stats else None
+    parse_executor = process_pool(args.parse_workers) if args.parse_workers else None
+    profiles = ThreadProfiles() if args.profile else None
+
+    try:
+        runner = BatchRunner(
+            fetcher, checkpoint,
+            concurrency=args.concurrency,
+            page_workers=args.page_workers,
+            parse_executor=parse_executor,
+            index=index,
+            store=store,
+            price_stats=price_stats,
+            duplicates=duplicates,
+            price_stats_path=args.price_stats,
+            profiles=profiles,
+        )
+        with instrument_run(args, 'batch'):
+            succeeded, failed, skipped = runner.run(jobs)
+        if profiles is not None:
+            profiles.save(args.profile)
+        print(f"\nBatch finished: {succeeded} succeeded, {failed} failed, {skipped} skipped")
+    finally:
+        if parse_executor is not None:
+            parse_executor.shutdown()
+        fetcher.close()
+        if index is not None:
+            index.close()
+        if duplicates is not None:
+            duplicates.close()
+        if price_stats is not None:
+            price_stats.save(args.price_stats)
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measure how long the scraper's modules take to import in a fresh interpreter.
+
+Usage:
+    python benchmarks/bench_imports.py [module ...] [--repeat 5]
+
+Each module is imported `repeat` times, each time in a new Python process
+(so nothing is already cached in sys.modules), and the median import time
+is reported with the heavy third-party packages the import pulled in. The
+core modules (URL building, parsing helpers, attribute extraction) must
+not load any of them; the script exits with status 1 if one does.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_PACKAGES = ('pandas', 'pyarrow', 'selenium', 'undetected_chromedriver', 'bs4', 'lxml', 'requests', 'psutil')
+
+# Modules that scripts and worker processes use without a browser or DataFrame
+CORE_MODULES = ('search_url', 'listing_parser', 'attribute_extractor', 'product_key', 'csv_utils', 'ebay_scraper')
+
+DEFAULT_MODULES = CORE_MODULES + ('fetchers', 'driver_pool', 'pipeline', 'batch_runner', 'results_store',
+                                  'duplicate_index')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def time_import(module):
+    """Import module in a fresh interpreter; returns (seconds, heavy packages loaded)"""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['seconds'], result['heavy']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_import('json')[0] for _ in range(args.repeat))
+
+    failed = []
+    print(f"{'module':<22}{'ms':>8}  heavy packages loaded")
+    for module in args.modules:
+        try:
+            runs = [time_import(module) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"{module:<22}{'-':>8}  import failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        seconds = statistics.median(run[0] for run in runs) - baseline
+        heavy = runs[-1][1]
+        print(f"{module:<22}{seconds * 1000:8.1f}  {', '.join(heavy) or '-'}")
+        if module in CORE_MODULES and heavy:
+            failed.append(module)
+
+    if failed:
+        print(f"\nCore modules load heavy dependencies at import: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
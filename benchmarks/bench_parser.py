@@ -0,0 +1,60 @@
+"""Compare listing parser backends on saved eBay result pages.
+
+Usage:
+    python benchmarks/bench_parser.py page1.html [page2.html ...] [--repeat 20]
+
+Each backend parses every page `repeat` times. The script checks that all
+backends return the same records and prints the time per page and per item
+for each, plus the speedup over the BeautifulSoup parser.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from listing_parser import PARSERS
+
+
+def time_backend(parse, pages, repeat):
+    """Return (seconds per page, records from the last pass)"""
+    records = None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        records = [parse(html) for html in pages]
+    elapsed = time.perf_counter() - started
+    return elapsed / (repeat * len(pages)), records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pages', nargs='+', help='saved search result HTML files')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+
+    timings = {}
+    outputs = {}
+    for name, parse in PARSERS.items():
+        timings[name], outputs[name] = time_backend(parse, pages, args.repeat)
+
+    items_per_page = sum(len(records) for records in outputs['bs4']) / len(pages)
+    print(f"{len(pages)} page(s), {items_per_page:.0f} items per page, {args.repeat} repeats\n")
+    for name, per_page in timings.items():
+        per_item = per_page / items_per_page if items_per_page else 0.0
+        speedup = timings['bs4'] / per_page
+        print(f"{name:>5}: {per_page * 1000:8.2f} ms/page  {per_item * 1e6:8.1f} us/item  {speedup:5.1f}x")
+
+    mismatched = [name for name, records in outputs.items() if records != outputs['bs4']]
+    if mismatched:
+        print(f"\nRecords differ from the bs4 parser for: {', '.join(mismatched)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
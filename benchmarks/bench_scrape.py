@@ -0,0 +1,210 @@
+"""Offline scrape benchmark and regression check against the stand-in server.
+
+Usage:
+    python benchmarks/bench_scrape.py --save-baseline     # record this machine's numbers once
+    python benchmarks/bench_scrape.py                     # compare against them
+    python benchmarks/bench_scrape.py --layouts li --pages 20 --latency 0.05 --threshold 0.2
+
+Each fixture layout is crawled with scrape_sold_items through
+benchmarks/standin_server.py, in a fresh Python process per run. The
+stand-in adds latency to every response and answers every Nth request
+with a bot-challenge page. A second plain HTTP fetcher stands in for the
+browser fallback. Each run reports pages per second, items per second,
+parse + extraction cost per item, and the scraping process's peak RSS
+(parser processes not included). The median of --repeat runs is kept.
+
+The run fails (exit status 1) if a crawl does not return every fixture
+item, if the filter page does not parse, or if a metric is more than
+--threshold worse than the saved baseline for the same settings.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin_server import LAYOUTS, StandInServer, load_fixture
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# metric -> True if higher is better
+METRICS_COMPARED = {
+    'pages_per_second': True,
+    'items_per_second': True,
+    'parse_us_per_item': False,
+    'peak_rss_mb': False,
+}
+
+# Settings that must match for numbers to be comparable with the baseline
+SETTINGS = ('pages', 'latency', 'challenge_every', 'workers', 'parse_workers')
+
+
+def run_once(layout, args):
+    """Crawl the stand-in once in this process and return the measurements"""
+    from ebay_scraper import EbayElectronicsScraper
+    from fetchers import FallbackFetcher, HostRateLimiter, HttpFetcher
+    from metrics import METRICS, MemorySampler
+
+    # No rate limit: the point is the scraper's own throughput
+    fetcher = FallbackFetcher(
+        HttpFetcher(rate_limiter=HostRateLimiter(0)),
+        HttpFetcher(rate_limiter=HostRateLimiter(0)),
+    )
+    previous_dir = os.getcwd()
+    with StandInServer(layout, args.pages, args.latency, args.challenge_every) as server, \
+            tempfile.TemporaryDirectory() as workdir, MemorySampler():
+        scraper = EbayElectronicsScraper(fetcher=fetcher, base_url=server.base_url)
+        # save_to_csv writes into the working directory
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                filters = scraper.get_available_filters('iphone')
+                started = time.perf_counter()
+                df = scraper.scrape_sold_items('iphone', {}, max_pages=args.pages, workers=args.workers,
+                                               parse_workers=args.parse_workers)
+                elapsed = time.perf_counter() - started
+        finally:
+            os.chdir(previous_dir)
+            scraper.close()
+        server_stats = server.stats()
+
+    snapshot = METRICS.snapshot()
+    parse_seconds = sum(
+        entry['sum'] for entry in snapshot
+        if entry['name'] == 'stage_seconds' and entry['labels']['stage'] in ('parse_html', 'extract_items')
+    )
+    peak_rss = max((entry['value'] for entry in snapshot if entry['name'] == 'peak_rss_bytes'), default=0)
+    pages = scraper.pipeline_stats['stages']['fetch']['processed']
+    items = len(df)
+    return {
+        'pages': pages,
+        'items': items,
+        'unique_ids': int(df['item_id'].nunique()) if items else 0,
+        'filter_colors': len((filters or {}).get('color', [])),
+        'filter_storage': len((filters or {}).get('storage', [])),
+        'challenges': server_stats['challenges'],
+        'escalations': fetcher.escalations,
+        'seconds': elapsed,
+        'pages_per_second': pages / elapsed,
+        'items_per_second': items / elapsed,
+        'parse_us_per_item': parse_seconds / items * 1e6 if items else 0.0,
+        'peak_rss_mb': peak_rss / (1024 * 1024),
+    }
+
+
+def run_in_subprocess(layout, args):
+    command = [
+        sys.executable, os.path.abspath(__file__), '--run-one', layout,
+        '--pages', str(args.pages), '--latency', str(args.latency),
+        '--challenge-every', str(args.challenge_every),
+        '--workers', str(args.workers), '--parse-workers', str(args.parse_workers),
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def expected_items_per_page(layout):
+    from listing_parser import parse_listing_page
+    return len(parse_listing_page(load_fixture(LAYOUTS[layout])))
+
+
+def check_run(layout, result, args):
+    """Return a list of problems with one layout's results"""
+    problems = []
+    expected = expected_items_per_page(layout) * args.pages
+    if result['items'] != expected or result['unique_ids'] != expected:
+        problems.append(f"{layout}: expected {expected} unique items, got {result['items']} "
+                        f"({result['unique_ids']} unique ids)")
+    if not result['filter_colors'] or not result['filter_storage']:
+        problems.append(f"{layout}: filter page gave {result['filter_colors']} colors, "
+                        f"{result['filter_storage']} storage options")
+    return problems
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regressions beyond threshold against the baseline"""
+    regressions = []
+    for layout, result in results.items():
+        reference = baseline.get(layout)
+        if not reference:
+            continue
+        for metric, higher_is_better in METRICS_COMPARED.items():
+            before, now = reference[metric], result[metric]
+            if not before:
+                continue
+            change = (now - before) / before
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append(f"{layout}: {metric} {before:.1f} -> {now:.1f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--layouts', nargs='+', choices=sorted(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02, metavar='SECONDS')
+    parser.add_argument('--challenge-every', type=int, default=7, metavar='N')
+    parser.add_argument('--workers', type=int, default=4, help="result pages fetched at once")
+    parser.add_argument('--parse-workers', type=int, default=2, help="parser processes (0 parses on a thread)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="fail if a metric is this much worse than the baseline (0.25 = 25%%)")
+    parser.add_argument('--run-one', metavar='LAYOUT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_once(args.run_one, args)))
+        return
+
+    results = {}
+    problems = []
+    print(f"{'layout':<15}{'pages/s':>9}{'items/s':>10}{'us/item':>9}{'RSS MB':>8}{'challenges':>12}")
+    for layout in args.layouts:
+        runs = [run_in_subprocess(layout, args) for _ in range(args.repeat)]
+        result = {metric: statistics.median(run[metric] for run in runs) for metric in METRICS_COMPARED}
+        results[layout] = result
+        for run in runs:
+            problems.extend(check_run(layout, run, args))
+        print(f"{layout:<15}{result['pages_per_second']:>9.1f}{result['items_per_second']:>10.0f}"
+              f"{result['parse_us_per_item']:>9.0f}{result['peak_rss_mb']:>8.0f}{runs[-1]['challenges']:>12}")
+
+    settings = {name: getattr(args, name) for name in SETTINGS}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved.get('settings') == settings:
+            baseline = saved['results']
+        elif not args.save_baseline:
+            print(f"\nBaseline in {args.baseline} was recorded with other settings; not comparing")
+    elif not args.save_baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+
+    problems.extend(compare(results, baseline, args.threshold))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'settings': settings, 'results': {**baseline, **results}}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if problems:
+        print("\nFailures:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Shared fixtures for the offline tests: the stand-in server and a scraper pointed at it."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin_server import LAYOUTS, StandInServer, load_fixture
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in its own directory; the scraper writes CSV files to the working directory"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def standin():
+    """Start stand-in servers on demand: standin(layout='li', pages=3, ...)"""
+    servers = []
+
+    def start(layout='li', pages=3, **options):
+        server = StandInServer(layout, pages, **options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_scraper():
+    """EbayElectronicsScraper over plain HTTP without rate limiting"""
+    from ebay_scraper import EbayElectronicsScraper
+    from fetchers import HostRateLimiter, HttpFetcher
+
+    scrapers = []
+
+    def make(server):
+        scraper = EbayElectronicsScraper(fetcher=HttpFetcher(rate_limiter=HostRateLimiter(0)),
+                                         base_url=server.base_url)
+        scrapers.append(scraper)
+        return scraper
+
+    yield make
+    for scraper in scrapers:
+        scraper.close()
+
+
+@pytest.fixture
+def fixture_items():
+    """Records of one results page in a layout, parsed straight from the fixture"""
+    from listing_parser import parse_listing_page
+
+    def parse(layout='li'):
+        return parse_listing_page(load_fixture(LAYOUTS[layout]))
+
+    return parse
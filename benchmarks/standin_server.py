@@ -0,0 +1,158 @@
+"""Local stand-in for eBay's search pages, serving the recorded fixtures.
+
+Sold-listing searches (`LH_Sold=1`) get a results page in the chosen
+layout and everything else gets the filter page. Page N is the fixture
+with every item id shifted, so each page adds new items. Requests past
+the last page get the last page again, which is what eBay does. Latency
+is added per request, and every Nth request can be answered with the
+bot-challenge page instead (at most once per URL, so a retry gets through).
+
+Usage:
+    python benchmarks/standin_server.py --layout li --pages 20 --latency 0.05 --challenge-every 7
+
+then point the scraper at it with EbayElectronicsScraper(base_url=...).
+"""
+import argparse
+import gzip
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Search result fixtures by layout: the parsers' three fallbacks
+LAYOUTS = {
+    'info_clearfix': 'search_info_clearfix.html',  # div.s-item__info.clearfix inside li.s-item
+    'info': 'search_info.html',                    # div.s-item__info without clearfix
+    'li': 'search_li.html',                        # bare li.s-item
+}
+FILTER_PAGE = 'filters.html'
+CHALLENGE_PAGE = 'challenge.html'
+
+ITEM_ID_RE = re.compile(r'(/itm/(?:[^/?"]+/)?)(\d{9,15})')
+# Shift between pages; larger than the id spread within one fixture
+PAGE_ID_STEP = 10 ** 7
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class StandInServer:
+    """Threaded HTTP server serving fixture pages on 127.0.0.1"""
+
+    def __init__(self, layout='info_clearfix', pages=10, latency=0.0, challenge_every=0, port=0):
+        self.results_page = load_fixture(LAYOUTS[layout])
+        self.filter_page = load_fixture(FILTER_PAGE).encode('utf-8')
+        self.challenge_page = load_fixture(CHALLENGE_PAGE).encode('utf-8')
+        self.pages = pages
+        self.latency = latency
+        self.challenge_every = challenge_every
+
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'results': 0, 'filters': 0, 'challenges': 0}
+        self.page_cache = {}
+        self.challenged = set()
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def results(self, page_number):
+        """Body of results page `page_number` (1-based)"""
+        page_number = min(max(page_number, 1), self.pages)
+        if page_number not in self.page_cache:
+            offset = (page_number - 1) * PAGE_ID_STEP
+            html = ITEM_ID_RE.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + offset}", self.results_page)
+            self.page_cache[page_number] = html.encode('utf-8')
+        return self.page_cache[page_number]
+
+    def respond(self, path):
+        """Pick the body for a request path and update the counters"""
+        query = parse_qs(urlsplit(path).query)
+        with self.lock:
+            self.counters['requests'] += 1
+            if (self.challenge_every and self.counters['requests'] % self.challenge_every == 0
+                    and path not in self.challenged):
+                self.challenged.add(path)
+                self.counters['challenges'] += 1
+                return self.challenge_page
+            if 'LH_Sold' not in query:
+                self.counters['filters'] += 1
+                return self.filter_page
+            self.counters['results'] += 1
+            return self.results(int(query.get('_pgn', ['1'])[0]))
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        standin = self.server.standin
+        if standin.latency:
+            time.sleep(standin.latency)
+        body = standin.respond(self.path)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='info_clearfix')
+    parser.add_argument('--pages', type=int, default=10, help="distinct result pages before the last one repeats")
+    parser.add_argument('--latency', type=float, default=0.0, metavar='SECONDS', help="delay added to every response")
+    parser.add_argument('--challenge-every', type=int, default=0, metavar='N',
+                        help="answer every Nth request with the bot-challenge page")
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    server = StandInServer(args.layout, args.pages, args.latency, args.challenge_every, args.port)
+    print(f"Serving {args.layout} pages on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
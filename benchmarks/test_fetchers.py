@@ -0,0 +1,207 @@
+"""Checks for the fetchers and browser helpers, with fake drivers standing in for Chrome"""
+import pytest
+
+from page_ready import wait_until_stable
+
+
+class FakeDriver:
+    """Replays (readyState, match count, ms since the last DOM change) for each poll"""
+
+    def __init__(self, states):
+        self.states = list(states)
+
+    def execute_script(self, script, *args):
+        if 'readyState' not in script:
+            return None
+        return self.states.pop(0) if len(self.states) > 1 else self.states[0]
+
+
+def test_wait_until_stable_returns_once_the_count_settles():
+    driver = FakeDriver([('loading', 0, 0), ('complete', 20, 0), ('complete', 60, 0), ('complete', 60, 600),
+                         ('complete', 60, 900)])
+    seconds, count, timed_out = wait_until_stable(driver, '.s-item', timeout=5, poll_interval=0.001)
+    assert (count, timed_out) == (60, False)
+    assert driver.states == [('complete', 60, 900)]
+
+
+def test_wait_until_stable_reads_quiet_pages_without_matches():
+    driver = FakeDriver([('complete', 0, 1000)])
+    seconds, count, timed_out = wait_until_stable(driver, '.x-refine__multi-select-label', timeout=5,
+                                                  poll_interval=0.001)
+    assert (count, timed_out) == (0, False)
+    assert seconds < 1
+
+
+def test_wait_until_stable_times_out_on_a_busy_page():
+    driver = FakeDriver([('complete', 60, 0)])
+    seconds, count, timed_out = wait_until_stable(driver, '.s-item', timeout=0.05, poll_interval=0.001)
+    assert timed_out
+    assert seconds == pytest.approx(0.05, abs=0.05)
+
+
+class FakePool:
+    def __init__(self, driver):
+        self.fake = driver
+
+    def driver(self):
+        from contextlib import nullcontext
+
+        return nullcontext(self.fake)
+
+
+def test_browser_waits_are_reported_in_metrics():
+    from fetchers import SeleniumFetcher
+    from metrics import METRICS
+
+    driver = FakeDriver([('complete', 3, 1000)])
+    driver.get = lambda url: None
+    driver.page_source = '<html><body><p>ready</p></body></html>'
+    METRICS.reset()
+    fetcher = SeleniumFetcher(FakePool(driver), poll_interval=0.001)
+
+    assert fetcher.fetch('https://www.ebay.com/sch/i.html?_nkw=iphone') == driver.page_source
+    waits, = [entry for entry in METRICS.snapshot() if entry['name'] == 'page_ready_seconds']
+    assert waits['labels'] == {'outcome': 'settled'} and waits['count'] == 1
+    assert 'browser page ready (settled): 1 pages' in METRICS.report()
+
+
+class FakeBrowser:
+    """Browser fallback that serves the stand-in's first results page"""
+
+    def __init__(self, server):
+        self.server = server
+        self.urls = []
+
+    def fetch(self, url, wait_for=None, **browser_options):
+        self.urls.append(url)
+        return self.server.results(1).decode('utf-8')
+
+    def close(self):
+        pass
+
+
+def http_fetcher():
+    from fetchers import HostRateLimiter, HttpFetcher
+
+    return HttpFetcher(retries=0, rate_limiter=HostRateLimiter(0))
+
+
+def test_fallback_escalates_only_challenges_and_pages_without_listings(standin):
+    from fetchers import FallbackFetcher
+
+    server = standin(challenge_every=3)
+    browser = FakeBrowser(server)
+    fetcher = FallbackFetcher(http_fetcher(), browser)
+    results_url = f"{server.base_url}/sch/i.html?_nkw=iphone&LH_Sold=1&LH_Complete=1&_pgn="
+
+    fetcher.fetch(f"{results_url}1", wait_for='s-item__title')
+    fetcher.fetch(f"{results_url}2", wait_for='s-item__title')
+    assert browser.urls == []
+
+    # The third request gets the bot check
+    assert 's-item__title' in fetcher.fetch(f"{results_url}3", wait_for='s-item__title')
+    assert browser.urls == [f"{results_url}3"]
+
+    # A page missing the markup the caller waits for escalates too
+    filter_url = f"{server.base_url}/sch/i.html?_nkw=iphone"
+    fetcher.fetch(filter_url, wait_for='x-refine__left__nav')
+    fetcher.fetch(f"{results_url}4", wait_for='x-refine__left__nav')
+    assert browser.urls[-1] == f"{results_url}4"
+    assert fetcher.escalations == 2
+    fetcher.close()
+
+
+def test_cache_replays_pages_without_the_network(tmp_path, standin):
+    from response_cache import CacheMiss, CachingFetcher, ResponseCache
+
+    server = standin(challenge_every=2)
+    cached, blocked = (f"{server.base_url}/sch/i.html?_nkw=iphone&LH_Sold=1&_pgn={number}" for number in (1, 2))
+    live = CachingFetcher(http_fetcher(), ResponseCache(str(tmp_path / 'cache')))
+    html = live.fetch(cached)
+    assert 'pardon our interruption' in live.fetch(blocked).lower()
+    live.close()
+    server.stop()
+
+    replay = CachingFetcher(None, ResponseCache(str(tmp_path / 'cache')), replay=True)
+    assert replay.fetch(cached) == html
+    # Challenge pages are never cached
+    with pytest.raises(CacheMiss):
+        replay.fetch(blocked)
+    assert replay.cache.stats()['hits'] == 1
+    replay.close()
+
+
+class FakeChrome:
+    def __init__(self):
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_driver_pool_recycles_worn_out_drivers(monkeypatch):
+    import time
+
+    import driver_pool
+
+    started = []
+
+    def create(block_resources):
+        started.append(FakeChrome())
+        return started[-1]
+
+    monkeypatch.setattr(driver_pool, 'create_chrome_driver', create)
+    memory = {}
+    monkeypatch.setattr(driver_pool, 'browser_memory_mb', lambda driver: memory.get(id(driver), 100))
+    pool = driver_pool.DriverPool(size=1, max_pages=2, max_memory_mb=500)
+
+    with pool.driver() as first:
+        pass
+    with pool.driver() as driver:
+        assert driver is first
+    # Two pages: the driver is replaced in the background
+    with pool.driver(timeout=5) as second:
+        assert second is not first and first.quit_called
+        # Grows past max_memory_mb during its first page
+        memory[id(second)] = 800
+    with pool.driver(timeout=5) as third:
+        assert third is not second and second.quit_called
+
+    with pytest.raises(RuntimeError):
+        with pool.driver(timeout=5):
+            raise RuntimeError('tab crashed')
+    time.sleep(0.05)
+    stats = pool.stats()
+    assert (stats['started'], stats['recycled'], stats['live']) == (4, 3, 1)
+    pool.close()
+
+
+def test_driver_pool_wakes_waiters_when_chrome_fails_to_start(monkeypatch):
+    import threading
+    import time
+
+    import driver_pool
+
+    def create(block_resources):
+        time.sleep(0.05)
+        raise OSError('Chrome not found')
+
+    monkeypatch.setattr(driver_pool, 'create_chrome_driver', create)
+    pool = driver_pool.DriverPool(size=1)
+    errors = []
+
+    def borrow():
+        try:
+            pool.acquire()
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(errors) == 4
+    assert pool.stats()['live'] == 0
@@ -0,0 +1,200 @@
+"""End-to-end checks of the scrape path against the stand-in server"""
+import random
+import time
+
+import pytest
+
+from attribute_extractor import for_device
+from duplicate_index import DuplicateIndex
+from listing_parser import parse_listing_page
+from pipeline import ScrapePipeline
+from price_stats import PriceStatsStore
+from standin_server import LAYOUTS, PAGE_ID_STEP, load_fixture
+
+
+def run_pipeline(pages=40, stop_at=None, parse_workers=0):
+    seen = []
+
+    def fetch(url):
+        time.sleep(random.uniform(0, 0.02))
+        return url
+
+    def sink(key, records):
+        seen.append(key)
+        return key != stop_at
+
+    pipeline = ScrapePipeline(fetch, lambda html: [html], sink, fetch_workers=6, parse_workers=parse_workers,
+                              queue_size=2)
+    stats = pipeline.run((number, f"page-{number}") for number in range(1, pages + 1))
+    return seen, stats
+
+
+def test_pipeline_sinks_pages_in_order():
+    seen, _ = run_pipeline()
+    assert seen == list(range(1, 41))
+
+
+def test_pipeline_stops_at_the_page_the_sink_rejects():
+    seen, stats = run_pipeline(stop_at=5)
+    assert seen == [1, 2, 3, 4, 5]
+    # The reorder window bounds how far fetching runs ahead of the stop
+    assert stats['stages']['fetch']['processed'] < 40
+
+
+def test_pipeline_marks_failed_pages():
+    received = {}
+
+    def fetch(url):
+        if url == 'page-2':
+            raise TimeoutError('read timed out')
+        return url
+
+    pipeline = ScrapePipeline(fetch, lambda html: [html], lambda key, records: received.setdefault(key, records),
+                              fetch_workers=2, parse_workers=0)
+    pipeline.run((number, f"page-{number}") for number in range(1, 4))
+    assert received == {1: ['page-1'], 2: None, 3: ['page-3']}
+
+
+def test_failed_page_fails_the_scrape(workdir, standin, make_scraper):
+    server = standin(pages=4)
+    scraper = make_scraper(server)
+    fetch = scraper.fetcher.fetch
+
+    def flaky_fetch(url, **options):
+        if '_pgn=2' in url:
+            raise TimeoutError('read timed out')
+        return fetch(url, **options)
+
+    scraper.fetcher.fetch = flaky_fetch
+    with pytest.raises(RuntimeError, match='page 2'):
+        scraper.scrape_sold_items('iphone', {}, max_pages=4, parse_workers=0, raise_errors=True)
+    assert not list(workdir.glob('*.csv'))
+
+
+def test_max_items_keeps_the_first_pages(standin, make_scraper):
+    server = standin(pages=3, latency=0.01)
+    df = make_scraper(server).scrape_sold_items('iphone', {}, max_pages=3, max_items=90, workers=3,
+                                                parse_workers=0)
+
+    assert len(df) == 90
+    item_ids = df['item_id'].astype(int)
+    first_page = item_ids < item_ids.min() + PAGE_ID_STEP
+    # All of page 1, then the start of page 2
+    assert first_page[:60].all() and not first_page[60:].any()
+
+
+def test_scrape_saves_rows_when_every_listing_is_a_near_duplicate(workdir, standin, make_scraper, fixture_items):
+    duplicates = DuplicateIndex(str(workdir / 'dup.sqlite'))
+    # The same listings seen before under other ids, as when sellers relist
+    earlier = duplicates.add([{**item, 'item_id': f"old{item['item_id']}"} for item in fixture_items('li')])
+    price_stats = PriceStatsStore()
+
+    server = standin('li', pages=1)
+    df = make_scraper(server).scrape_sold_items('iphone', {}, max_pages=1, parse_workers=0,
+                                                duplicates=duplicates, price_stats=price_stats)
+
+    assert len(df) > 0
+    assert set(df['cluster_id']) <= {cluster_id for cluster_id, _, _ in earlier}
+    assert price_stats.summary('iphone') == {'count': 0}
+    assert list(workdir.glob('iphone_sold_items_*.csv'))
+    duplicates.close()
+
+
+def test_rescraping_does_not_count_sales_twice(workdir, standin, make_scraper):
+    duplicates = DuplicateIndex(str(workdir / 'dup.sqlite'))
+    price_stats = PriceStatsStore()
+    server = standin('li', pages=2)
+    scraper = make_scraper(server)
+
+    scraper.scrape_sold_items('iphone', {}, max_pages=2, parse_workers=0, duplicates=duplicates,
+                              price_stats=price_stats)
+    counted = price_stats.summary('iphone')['count']
+    scraper.scrape_sold_items('iphone', {}, max_pages=2, parse_workers=0, duplicates=duplicates,
+                              price_stats=price_stats)
+
+    assert counted > 0
+    assert price_stats.summary('iphone')['count'] == counted
+    duplicates.close()
+
+
+def test_incremental_poll_fetches_only_page_one_when_nothing_is_new(workdir, standin, make_scraper):
+    from item_index import ItemIndex
+
+    index = ItemIndex(str(workdir / 'index.sqlite'))
+    server = standin(pages=4)
+    scraper = make_scraper(server)
+    first = scraper.scrape_sold_items('iphone', {}, max_pages=4, workers=4, parse_workers=0, index=index)
+    again = scraper.scrape_sold_items('iphone', {}, max_pages=4, workers=4, parse_workers=0, index=index)
+
+    assert len(first) == 240
+    assert len(again) == 0
+    assert scraper.pipeline_stats['stages']['fetch']['processed'] == 1
+    index.close()
+
+
+def test_incremental_run_stops_at_the_first_known_items(workdir, standin, make_scraper):
+    from item_index import ItemIndex, query_key
+
+    index = ItemIndex(str(workdir / 'index.sqlite'))
+    server = standin(pages=4)
+    scraper = make_scraper(server)
+    # An earlier run saw what is now page 2: everything sold since then is on page 1
+    page_two = [{**item, 'item_id': str(int(item['item_id']) + PAGE_ID_STEP)}
+                for item in parse_listing_page(load_fixture(LAYOUTS['li']))]
+    index.add(query_key(scraper.build_search_url('iphone', {})), page_two)
+
+    df = scraper.scrape_sold_items('iphone', {}, max_pages=4, workers=4, parse_workers=0, index=index)
+
+    assert len(df) == 60
+    assert df['item_id'].astype(int).max() < min(int(item['item_id']) for item in page_two)
+    assert len(list(workdir.glob('iphone_sold_items.csv'))) == 1
+    assert index.count() == 120
+    index.close()
+
+
+def test_price_stats_needs_an_index_or_duplicates(standin, make_scraper):
+    server = standin(pages=1)
+    with pytest.raises(ValueError):
+        make_scraper(server).scrape_sold_items('iphone', {}, max_pages=1, price_stats=PriceStatsStore())
+
+
+@pytest.mark.parametrize('layout', sorted(LAYOUTS))
+def test_lxml_and_bs4_parsers_agree(layout):
+    from listing_parser import parse_listing_page_bs4, parse_listing_page_lxml
+
+    html = load_fixture(LAYOUTS[layout])
+    records = parse_listing_page_lxml(html)
+    assert len(records) == 60
+    assert parse_listing_page_bs4(html) == records
+
+
+def test_new_listing_badge_is_not_a_condition():
+    from listing_parser import build_record
+
+    url = 'https://www.ebay.com/itm/123456789012'
+    badge_only = build_record('New ListingApple iPhone 12 64GB Black Unlocked', '$300.00', url, 'Sold  Oct 1, 2026',
+                              'Free shipping')
+    assert badge_only.get('condition') is None
+    used = build_record('New ListingApple iPhone 12 64GB Black Unlocked Pre-Owned', '$300.00', url,
+                        'Sold  Oct 1, 2026', 'Free shipping')
+    assert (used['condition'], used['storage'], used['color']) == ('Pre-owned', '64GB', 'Black')
+
+
+def test_laptop_scrape_extracts_laptop_attributes():
+    html = ('<li class="s-item"><div class="s-item__title">Dell XPS 13 Intel Core i7-1165G7 16GB RAM 512GB SSD</div>'
+            '<span class="s-item__price">$500</span></li>')
+    record, = parse_listing_page(html, device_type='laptop')
+    assert record['processor']
+    assert record['ram'] == '16GB'
+
+
+def test_extract_series_matches_extract():
+    import pandas as pd
+
+    titles = ['Apple iPhone 13 Pro 128GB Blue', None, 'Samsung Galaxy S23 256 GB Black', 'Apple iPhone 13 Pro 128GB Blue']
+    extractor = for_device()
+    df = extractor.extract_series(pd.Series(titles, index=[5, 6, 7, 8]))
+
+    expected = pd.DataFrame.from_records([extractor.extract(title) for title in titles], columns=extractor.categories,
+                                         index=[5, 6, 7, 8])
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
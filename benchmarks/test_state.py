@@ -0,0 +1,329 @@
+"""Checks for the stateful modules: response cache, checkpoints, price sketches and the duplicate index."""
+import random
+import statistics
+
+import pytest
+
+from batch_runner import DONE, FAILED, BatchRunner, Checkpoint
+from duplicate_index import DuplicateIndex
+from item_index import query_key
+from price_stats import PriceStatsStore, RunningStats, TDigest
+from response_cache import ResponseCache
+from results_store import ResultsStore
+from search_url import build_search_url
+
+SOLD_URL = 'https://www.ebay.com/sch/i.html?_nkw=iphone&LH_Sold=1&LH_Complete=1'
+
+
+def page(number, size=4000):
+    # Random text compresses poorly, so every page has about the same size on disk
+    rng = random.Random(number)
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(size))
+
+
+def test_cache_entries_expire_after_their_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    cache.put(SOLD_URL, 'fresh', ttl=60)
+    cache.put(f"{SOLD_URL}&_pgn=2", 'stale', ttl=-1)
+
+    assert cache.get(SOLD_URL) == 'fresh'
+    assert cache.get(f"{SOLD_URL}&_pgn=2") is None
+    # Replay serves expired pages
+    assert cache.get(f"{SOLD_URL}&_pgn=2", allow_expired=True) == 'stale'
+    assert cache.stats()['expired'] == 1
+    cache.close()
+
+
+def test_cache_key_ignores_parameter_order(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    cache.put('https://www.ebay.com/sch/i.html?b=2&a=1', 'page')
+    assert cache.get('https://WWW.EBAY.COM/sch/i.html?a=1&b=2') == 'page'
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr('response_cache.time.time', lambda: next(clock))
+    cache = ResponseCache(str(tmp_path / 'cache'))
+    cache.put(f"{SOLD_URL}&_pgn=1", page(1))
+    cache.max_bytes = int(cache.stats()['bytes'] * 2.5)
+    cache.put(f"{SOLD_URL}&_pgn=2", page(2))
+    cache.get(f"{SOLD_URL}&_pgn=1")  # page 1 is now more recent than page 2
+    cache.put(f"{SOLD_URL}&_pgn=3", page(3))
+
+    assert cache.stats()['evictions'] == 1
+    assert cache.get(f"{SOLD_URL}&_pgn=2") is None
+    assert cache.get(f"{SOLD_URL}&_pgn=1") == page(1)
+    assert cache.get(f"{SOLD_URL}&_pgn=3") == page(3)
+    cache.close()
+
+
+def test_checkpoint_resume_skips_done_jobs(tmp_path, standin, make_scraper):
+    server = standin(pages=1)
+    fetcher = make_scraper(server).fetcher
+    jobs = [
+        {'id': 'done-before', 'device_type': 'iphone', 'filters': {}, 'max_pages': 1},
+        {'id': 'new', 'device_type': 'iphone', 'filters': {'storage': ['128GB']}, 'max_pages': 1},
+    ]
+    path = str(tmp_path / 'jobs.checkpoint.json')
+    Checkpoint(path).update('done-before', status=DONE, items=60)
+
+    runner = BatchRunner(fetcher, Checkpoint(path), concurrency=2, base_url=server.base_url)
+    assert runner.run(jobs) == (1, 0, 1)
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.status('new') == DONE
+    assert checkpoint.jobs['new']['items'] == 60
+    assert checkpoint.jobs['done-before']['attempts'] == 0
+
+
+def test_batch_job_fails_when_saving_fails(tmp_path, standin, make_scraper):
+    class BrokenStore:
+        def write(self, df, device_type):
+            raise OSError('disk full')
+
+    server = standin(pages=1)
+    checkpoint = Checkpoint(str(tmp_path / 'jobs.checkpoint.json'))
+    runner = BatchRunner(make_scraper(server).fetcher, checkpoint, store=BrokenStore(), base_url=server.base_url)
+    job = {'id': 'a', 'device_type': 'iphone', 'filters': {}, 'max_pages': 1}
+
+    assert runner.run([job]) == (0, 1, 0)
+    assert checkpoint.status('a') == FAILED
+    assert checkpoint.jobs['a']['error'] == 'disk full'
+
+
+def test_batch_saves_price_stats_before_marking_a_job_done(tmp_path, standin, make_scraper):
+    from item_index import ItemIndex
+
+    class RecordingCheckpoint(Checkpoint):
+        saved_when_done = None
+
+        def update(self, job_id, **fields):
+            if fields.get('status') == DONE:
+                # What a resume would find if the process died right after this
+                self.saved_when_done = PriceStatsStore.load(stats_path).summary('iphone')['count']
+            super().update(job_id, **fields)
+
+    server = standin(pages=1)
+    stats_path = str(tmp_path / 'stats.json.gz')
+    checkpoint = RecordingCheckpoint(str(tmp_path / 'jobs.checkpoint.json'))
+    index = ItemIndex(str(tmp_path / 'index.sqlite'))
+    runner = BatchRunner(make_scraper(server).fetcher, checkpoint, index=index, price_stats=PriceStatsStore(),
+                         price_stats_path=stats_path, base_url=server.base_url)
+
+    assert runner.run([{'id': 'a', 'device_type': 'iphone', 'filters': {}, 'max_pages': 1}]) == (1, 0, 0)
+    assert checkpoint.saved_when_done == 60
+    index.close()
+
+
+def test_batch_profile_covers_the_job_threads(tmp_path, standin, make_scraper):
+    import pstats
+
+    from metrics import ThreadProfiles
+
+    server = standin(pages=1)
+    profiles = ThreadProfiles()
+    runner = BatchRunner(make_scraper(server).fetcher, Checkpoint(str(tmp_path / 'jobs.checkpoint.json')),
+                         concurrency=2, profiles=profiles, base_url=server.base_url)
+    jobs = [{'id': str(number), 'device_type': 'iphone', 'filters': {}, 'max_pages': 1} for number in range(2)]
+    assert runner.run(jobs) == (2, 0, 0)
+
+    path = str(tmp_path / 'batch.prof')
+    profiles.save(path)
+    functions = {function for _, _, function in pstats.Stats(path).stats}
+    assert 'scrape_sold_items' in functions
+
+
+def test_metrics_merge_and_prometheus_output():
+    from metrics import Metrics, call_with_metrics
+
+    def parse(html):
+        from metrics import METRICS
+
+        METRICS.count('items', 3, source='lxml')
+        METRICS.observe('stage_seconds', 0.25, stage='parse')
+        return html.upper()
+
+    # What a parser process sends back: its result and the metrics it recorded
+    result, entries = call_with_metrics(parse, 'page')
+    assert result == 'PAGE'
+
+    metrics = Metrics()
+    metrics.observe('stage_seconds', 0.75, stage='parse')
+    metrics.peak('peak_rss_bytes', 100)
+    metrics.merge(entries)
+    metrics.merge([{'type': 'gauge', 'name': 'peak_rss_bytes', 'labels': {}, 'value': 50}])
+
+    lines = metrics.to_prometheus().splitlines()
+    assert '# TYPE scraper_items_total counter' in lines
+    assert 'scraper_items_total{source="lxml"} 3' in lines
+    assert 'scraper_stage_seconds_count{stage="parse"} 2' in lines
+    assert 'scraper_stage_seconds_sum{stage="parse"} 1.0' in lines
+    assert 'scraper_stage_seconds_max{stage="parse"} 0.75' in lines
+    assert 'scraper_peak_rss_bytes 100' in lines
+
+
+def test_running_stats_merge_matches_one_pass():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(6, 0.5) for _ in range(5000)]
+    left, right = RunningStats(), RunningStats()
+    for value in values[:1234]:
+        left.add(value)
+    for value in values[1234:]:
+        right.add(value)
+    left.merge(right)
+
+    assert left.count == len(values)
+    assert left.mean == pytest.approx(statistics.fmean(values))
+    assert left.variance == pytest.approx(statistics.variance(values))
+    assert (left.min, left.max) == (min(values), max(values))
+
+
+def test_tdigest_merge_keeps_quantiles_accurate():
+    rng = random.Random(3)
+    values = [rng.uniform(100, 1100) for _ in range(20000)]
+    digests = [TDigest() for _ in range(4)]
+    for number, value in enumerate(values):
+        digests[number % 4].add(value)
+    merged = digests[0]
+    for digest in digests[1:]:
+        merged.merge(digest)
+
+    ordered = sorted(values)
+    for q in (0.1, 0.5, 0.9):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        # Within half a percentile of the exact value
+        assert abs(merged.quantile(q) - exact) < 0.005 * 1000
+
+
+def test_price_stats_store_round_trips(tmp_path):
+    store = PriceStatsStore()
+    store.update('iphone', [
+        {'price': 500.0, 'storage': '128GB', 'color': 'Black', 'condition': 'Pre-owned',
+         'sold_date': '2026-10-01', 'product_key': 'apple/iphone-14/pro/128gb'},
+        {'price': 520.0, 'storage': '128GB', 'color': 'Blue', 'condition': 'Pre-owned', 'sold_date': '2026-10-02',
+         'product_key': 'apple/iphone-14/pro/128gb'},
+    ])
+    path = str(tmp_path / 'stats.json.gz')
+    store.save(path)
+    loaded = PriceStatsStore.load(path)
+
+    assert loaded.summary('iphone', storage='128GB')['count'] == 2
+    assert loaded.summary('iphone', storage='128GB', color='Blue')['mean'] == 520.0
+    assert loaded.summary('iphone', product_key='apple/iphone-14/pro/128gb')['median'] == pytest.approx(510.0)
+
+
+def test_price_stats_keep_old_and_undated_sales_out_of_day_windows():
+    from datetime import date, timedelta
+
+    today = date.today()
+    store = PriceStatsStore(retention_days=90)
+    store.update('iphone', [
+        {'price': 100.0, 'sold_date': (today - timedelta(days=400)).isoformat()},
+        {'price': 200.0},
+        {'price': 300.0, 'sold_date': today.isoformat()},
+    ])
+
+    assert store.summary('iphone')['count'] == 3
+    assert store.summary('iphone', days=7)['count'] == 1
+    assert store.summary('iphone', days=7)['mean'] == 300.0
+
+
+def listing(item_id, title, price=600.0, sold_date='2026-10-01', product_key='apple/iphone-13/pro/128gb', **fields):
+    return {'item_id': item_id, 'name': title, 'price': price, 'sold_date': sold_date,
+            'product_key': product_key, **fields}
+
+
+TITLE = 'Apple iPhone 13 Pro 128GB Sierra Blue Unlocked Good Condition'
+
+
+def test_duplicate_index_clusters_relists(tmp_path):
+    index = DuplicateIndex(str(tmp_path / 'dup.sqlite'))
+    results = index.add([
+        listing('1', TITLE),
+        listing('2', f"New Listing{TITLE}!", sold_date='2026-10-02'),
+        listing('3', TITLE.replace('128GB', '256GB'), product_key='apple/iphone-13/pro/256gb'),
+        listing('4', TITLE, price=610.0),
+        listing('5', TITLE, sold_date='2026-10-20'),
+        listing('6', TITLE, shipping=15.0, condition='Pre-owned'),
+    ])
+
+    cluster = results[0][0]
+    assert results[0] == (cluster, False, False)
+    assert results[1] == (cluster, True, False)
+    # Other storage, another price and a sale weeks later are separate sales
+    assert [duplicate for _, duplicate, _ in results[2:5]] == [False, False, False]
+    # Unknown shipping and condition do not conflict
+    assert results[5] == (cluster, True, False)
+    assert len({cluster_id for cluster_id, _, _ in results}) == 4
+    index.close()
+
+    index = DuplicateIndex(str(tmp_path / 'shipping.sqlite'))
+    results = index.add([listing('1', TITLE, shipping=15.0), listing('2', TITLE, shipping=0.0)])
+    assert results[1][1] is False
+    index.close()
+
+
+def test_duplicate_index_reports_listings_it_already_holds(tmp_path):
+    path = str(tmp_path / 'dup.sqlite')
+    records = [listing('1', TITLE), listing('2', f"{TITLE}!")]
+    index = DuplicateIndex(path)
+    first = index.add(records)
+    index.close()
+
+    index = DuplicateIndex(path)
+    again = index.add(records)
+    assert [(cluster_id, duplicate) for cluster_id, duplicate, _ in again] == \
+        [(cluster_id, duplicate) for cluster_id, duplicate, _ in first]
+    assert all(indexed for _, _, indexed in again)
+    assert index.count() == (2, 1)
+    index.close()
+
+    with pytest.raises(ValueError):
+        DuplicateIndex(path, num_perm=32, bands=8)
+
+
+def test_duplicate_index_keeps_separate_sales_of_a_popular_sku(tmp_path):
+    from datetime import date, timedelta
+
+    titles = ['Apple iPhone 14 Pro 128GB Space Black Unlocked', 'Apple iPhone 14 Pro 128GB Space Black Unlocked!',
+              'NEW LISTING Apple iPhone 14 Pro 128GB Space Black Unlocked']
+    start = date(2026, 10, 1)
+    sales = [listing(str(1000 + number), titles[number % 3], price=560.0 + number * 2.75,
+                     sold_date=(start + timedelta(days=number % 14)).isoformat(),
+                     product_key='apple/iphone-14/pro/128gb', color='Space Black')
+             for number in range(30)]
+    index = DuplicateIndex(str(tmp_path / 'dup.sqlite'))
+
+    assert not any(duplicate for _, duplicate, _ in index.add(sales))
+    assert index.count() == (30, 30)
+    # A copy of a recent sale under a new item id still joins its cluster
+    copy = {**sales[-2], 'item_id': '9999'}
+    assert index.add([copy])[0][1] is True
+    index.close()
+
+
+def test_query_key_ignores_paging_and_sorting():
+    url = build_search_url('iphone 14', {'storage': ['128GB']})
+    paged = build_search_url('iphone 14', {'storage': ['128GB']}, page=3, per_page=240, sort=13)
+    assert query_key(url) == query_key(paged)
+    assert query_key(url) != query_key(build_search_url('iphone 14', {'storage': ['256GB']}))
+
+
+def test_store_accepts_results_read_back_from_csv(tmp_path):
+    import pandas as pd
+
+    pd.DataFrame({
+        'name': ['iPhone 13 64GB', 'iPhone 12'],
+        'price': [300.0, 200.0],
+        'item_id': ['123456789012', None],
+        'sold_date': ['2026-10-01', None],
+        'storage': ['64GB', None],
+    }).to_csv('history.csv', index=False)
+    history = pd.read_csv('history.csv')
+
+    store = ResultsStore(str(tmp_path / 'store'))
+    store.write(history, 'iphone')
+    loaded = store.load('iphone', columns=['item_id', 'storage'])
+    assert loaded['item_id'].tolist()[0] == '123456789012'
+    assert loaded['storage'].tolist()[0] == '64GB'
@@ -1,6 +1,16 @@
-import pandas as pd
+import os
+import threading
+import uuid
 from datetime import datetime
 
+# One lock per CSV file, so concurrent batch jobs never interleave writes to it
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+def _file_lock(filename):
+    with _file_locks_lock:
+        return _file_locks.setdefault(os.path.abspath(filename), threading.Lock())
+
 def save_to_csv(df, device_type, filters=None):
     """
     Save the DataFrame to a CSV file with timestamp
@@ -8,20 +18,50 @@ def save_to_csv(df, device_type, filters=None):
     # Create timestamp
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    # Create filename with device type and timestamp
-    base_filename = f"{device_type}_sold_items_{timestamp}.csv"
+    # Create filename with device type and timestamp; the random suffix keeps
+    # jobs for the same device that finish in the same second apart
+    base_filename = f"{device_type}_sold_items_{timestamp}_{uuid.uuid4().hex[:8]}.csv"
     
     # Save to CSV
     df.to_csv(base_filename, index=False)
     print(f"\nDetailed results have been saved to {base_filename}")
     
-def load_recent_results(device_type):
+def append_to_csv(df, device_type):
     """
-    Load the most recent CSV file for a given device type
+    Append rows to the running {device_type}_sold_items.csv file used by incremental runs
+    """
+    import pandas as pd
+    
+    filename = f"{device_type}_sold_items.csv"
+    
+    # Jobs with different filters share this file; the header check, rewrite
+    # and append must not interleave
+    with _file_lock(filename):
+        if os.path.exists(filename):
+            columns = list(pd.read_csv(filename, nrows=0).columns)
+            new_columns = [column for column in df.columns if column not in columns]
+            if new_columns:
+                # Rare schema change: rewrite the file once with the extra columns
+                pd.concat([pd.read_csv(filename), df], ignore_index=True).to_csv(filename, index=False)
+            else:
+                df.reindex(columns=columns).to_csv(filename, mode='a', header=False, index=False)
+        else:
+            df.to_csv(filename, index=False)
+    print(f"\n{len(df)} new rows have been appended to {filename}")
+    
+def load_recent_results(device_type, store_dir=None):
+    """
+    Load the most recent results for a given device type
+    
+    Results saved to a ResultsStore are looked up through its manifest;
+    otherwise the newest timestamped CSV file is used.
     """
     try:
         import glob
-        import os
+        
+        if store_dir is not None:
+            from results_store import ResultsStore
+            return ResultsStore(store_dir).load_recent(device_type)
         
         # Find all matching CSV files
         files = glob.glob(f"{device_type}_sold_items_*.csv")
@@ -32,7 +72,8 @@ def load_recent_results(device_type):
         # Get the most recent file
         latest_file = max(files, key=os.path.getctime)
         
-        # Load and return the DataFrame
+        # Load and return the DataFrame (pandas is only needed once a file is found)
+        import pandas as pd
         return pd.read_csv(latest_file)
     except Exception as e:
         print(f"Error loading recent results: {str(e)}")
@@ -0,0 +1,238 @@
+"""Pool of reusable headless Chrome drivers for pages that need a browser.
+
+Starting Chrome is the slowest part of a browser fetch, so drivers are kept
+warm and handed out per page. A driver is recycled after max_pages pages or
+once its browser grows past max_memory_mb. Images, media, fonts,
+stylesheets and third-party tracking scripts are blocked through the
+DevTools protocol since the scraper only needs the listing markup.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# undetected_chromedriver, selenium and psutil are imported on first use:
+# creating a pool does not start a browser, and most runs never need one
+from metrics import METRICS
+
+# URL patterns passed to Network.setBlockedURLs
+BLOCKED_URL_PATTERNS = [
+    # Images
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico', '*i.ebayimg.com*',
+    # Media
+    '*.mp4', '*.webm', '*.m3u8', '*.mp3',
+    # Fonts
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    # Stylesheets
+    '*.css',
+    # Third-party ads and tracking scripts
+    '*doubleclick.net*', '*googlesyndication.com*', '*googletagmanager.com*', '*google-analytics.com*',
+    '*googleadservices.com*', '*facebook.net*', '*criteo.*', '*scorecardresearch.com*', '*adnxs.com*',
+    '*bing.com/bat*', '*hotjar.com*',
+]
+
+
+def create_chrome_driver(block_resources=True):
+    """Start a headless undetected Chrome, optionally blocking heavy resources"""
+    import undetected_chromedriver as uc
+
+    options = uc.ChromeOptions()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+
+    # Create undetected Chrome driver
+    driver = uc.Chrome(
+        options=options,
+        driver_executable_path=None,  # Will be downloaded automatically
+        browser_executable_path=None,  # Will use system Chrome
+    )
+
+    # Set window size for headless mode
+    driver.set_window_size(1920, 1080)
+
+    if block_resources:
+        # Blocking stays in effect for every page this driver loads
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+
+    return driver
+
+
+def browser_memory_mb(driver):
+    """Resident memory of the driver's browser processes in MB, if measurable"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    browser_pid = getattr(driver, 'browser_pid', None)
+    if psutil is not None and browser_pid:
+        try:
+            browser = psutil.Process(browser_pid)
+            processes = [browser] + browser.children(recursive=True)
+            return sum(process.memory_info().rss for process in processes) / (1024 * 1024)
+        except psutil.Error:
+            return None
+    try:
+        # Without psutil, fall back to the page's JS heap as a rough proxy
+        heap = driver.execute_script("return window.performance.memory.usedJSHeapSize")
+        return heap / (1024 * 1024) if heap else None
+    except Exception:
+        return None
+
+
+class DriverPool:
+    """Hand out up to `size` warm Chrome drivers and recycle worn-out ones"""
+
+    def __init__(self, size=2, max_pages=50, max_memory_mb=1024, block_resources=True):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.block_resources = block_resources
+
+        self.lock = threading.Lock()
+        # Signalled whenever a driver goes idle or a slot frees up (including
+        # when a driver fails to start), so callers waiting in acquire() re-check
+        self.available = threading.Condition(self.lock)
+        self.idle = deque()
+        self.live = 0
+        self.pages = {}
+        self.counters = {'started': 0, 'recycled': 0, 'pages': 0}
+        self.closed = False
+
+    def warm(self, count=None):
+        """Start drivers up front (in parallel) so the first pages do not wait"""
+        count = self.size if count is None else min(count, self.size)
+        threads = []
+        for _ in range(count):
+            with self.lock:
+                if self.live >= self.size:
+                    break
+                self.live += 1
+            thread = threading.Thread(target=self._start_into_idle)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def _start_driver(self):
+        try:
+            with METRICS.timer('driver_setup'):
+                driver = create_chrome_driver(self.block_resources)
+        except Exception as e:
+            with self.available:
+                self.live -= 1
+                self.available.notify_all()
+            print(f"Error setting up Chrome driver: {str(e)}")
+            raise
+        with self.lock:
+            self.pages[id(driver)] = 0
+            self.counters['started'] += 1
+        return driver
+
+    def _start_into_idle(self):
+        try:
+            driver = self._start_driver()
+        except Exception:
+            return
+        if self.closed:
+            self._discard(driver)
+        else:
+            self._put_idle(driver)
+
+    def _put_idle(self, driver):
+        with self.available:
+            self.idle.append(driver)
+            self.available.notify()
+
+    def acquire(self, timeout=None):
+        """Take an idle driver, starting one if the pool is not full yet
+
+        Raises TimeoutError if no driver frees up within timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.available:
+            while not self.idle and self.live >= self.size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No Chrome driver became available within {timeout}s")
+                self.available.wait(remaining)
+            if self.idle:
+                return self.idle.popleft()
+            self.live += 1
+        return self._start_driver()
+
+    def release(self, driver, broken=False):
+        """Return a driver after one page; recycle it if broken or worn out"""
+        with self.lock:
+            self.pages[id(driver)] = self.pages.get(id(driver), 0) + 1
+            self.counters['pages'] += 1
+            pages = self.pages[id(driver)]
+
+        if not broken and not self.closed:
+            memory = browser_memory_mb(driver) if self.max_memory_mb else None
+            if pages < self.max_pages and (memory is None or memory < self.max_memory_mb):
+                self._put_idle(driver)
+                return
+
+        with self.lock:
+            self.counters['recycled'] += 1
+            replace = not self.closed
+        if not replace:
+            self._discard(driver)
+            return
+        # The worn-out driver's slot passes straight to its replacement, so a
+        # caller waiting in acquire() cannot start an extra driver meanwhile
+        with self.lock:
+            self.pages.pop(id(driver), None)
+        self._quit(driver)
+        # Start the replacement in the background; it wakes any caller
+        # blocked in acquire() once it is ready, or once it fails to start
+        threading.Thread(target=self._start_into_idle, daemon=True).start()
+
+    def _discard(self, driver):
+        with self.available:
+            self.live -= 1
+            self.pages.pop(id(driver), None)
+            self.available.notify()
+        self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except:
+            pass
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """Borrow a driver for one page load"""
+        from selenium.common.exceptions import TimeoutException
+
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except TimeoutException:
+            # The page was slow or lacked the markup; the driver itself is fine
+            raise
+        except Exception:
+            # A driver that failed mid-page may be in a bad state
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken)
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'live': self.live, 'idle': len(self.idle)}
+
+    def close(self):
+        self.closed = True
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                driver = self.idle.popleft()
+            self._discard(driver)
@@ -0,0 +1,332 @@
+"""Persistent near-duplicate index for sold listings.
+
+The same item is often listed more than once (relisted after a failed
+sale, cross-posted by the seller, or copied by another seller), and each
+copy would otherwise count as a separate sale. Titles are normalized and
+cut into character shingles, and each listing gets a MinHash signature.
+The signature is split into LSH bands, and each band is stored as a
+bucket in SQLite. A new listing only compares against the listings that
+share one of its buckets, so matching stays sublinear as the index grows
+to millions of rows. A candidate counts as a duplicate when:
+
+- the estimated title similarity reaches the threshold,
+- the prices are within a tolerance and the sold dates are close, and
+- both listings resolve to the same canonical product key and neither
+  names a different color, condition or shipping cost than the other.
+
+Popular products sell many times a week under the same catalog title, so
+the defaults are strict: near-identical titles, the same price to the
+cent and sold within 3 days. Separate sales of one SKU at different
+prices or on different days stay separate; only copies of one sale merge.
+
+Duplicates join the first listing's cluster, so every listing in the
+index carries a cluster_id.
+
+Usage (backfill older CSV files):
+    python duplicate_index.py iphone_sold_items.csv --index duplicate_index.sqlite
+"""
+import argparse
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+
+DEFAULT_DUPLICATE_INDEX_PATH = 'duplicate_index.sqlite'
+
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 4
+SEED = 1
+# Titles hashed per numpy pass in MinHasher.signatures
+SIGNATURE_BATCH = 1024
+
+# Modulus of the MinHash permutations; a * x + b stays below 2**64 for 32-bit shingle hashes
+_PRIME = (1 << 31) - 1
+_BUCKET_MULTIPLIER = 0x100000001B3
+
+_NOISE_RE = re.compile(r'^new listing\s*', re.IGNORECASE)
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_title(title):
+    """Lower-case title without eBay's 'New Listing' prefix or punctuation"""
+    title = _NOISE_RE.sub('', title or '')
+    return ' '.join(_NON_WORD_RE.sub(' ', title.lower()).split())
+
+
+def shingles(title, size=SHINGLE_SIZE):
+    """crc32 hashes of the character shingles of a normalized title"""
+    text = normalize_title(title)
+    if len(text) <= size:
+        return np.array([zlib.crc32(text.encode('utf-8'))], dtype=np.uint64)
+    hashes = {zlib.crc32(text[start:start + size].encode('utf-8')) for start in range(len(text) - size + 1)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+class MinHasher:
+    """MinHash signatures over title shingles, and their LSH band buckets"""
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=SEED):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+        self.band_salt = rng.integers(1, 2 ** 63, bands, dtype=np.uint64)
+
+    def signatures(self, titles):
+        """uint32 MinHash signatures of many titles, one row per title"""
+        titles = list(titles)
+        signatures = np.empty((len(titles), self.num_perm), dtype=np.uint32)
+        # Sub-batches bound the (shingles x permutations) working array to a few MB
+        for start in range(0, len(titles), SIGNATURE_BATCH):
+            hashed = [shingles(title) for title in titles[start:start + SIGNATURE_BATCH]]
+            # The batch's shingles go through the permutations at once; reduceat takes each title's minimum
+            offsets = np.cumsum([0] + [len(hashes) for hashes in hashed[:-1]])
+            permuted = (np.concatenate(hashed)[:, np.newaxis] * self.a + self.b) % _PRIME
+            signatures[start:start + len(hashed)] = np.minimum.reduceat(permuted, offsets, axis=0)
+        return signatures
+
+    def buckets(self, signatures):
+        """One signed 64-bit bucket id per band for each signature row"""
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        # Polynomial hash of each band's values, seeded per band; uint64 arithmetic wraps
+        buckets = np.broadcast_to(self.band_salt, bands.shape[:2]).copy()
+        with np.errstate(over='ignore'):
+            for row in range(self.rows):
+                buckets = buckets * np.uint64(_BUCKET_MULTIPLIER) + bands[:, :, row]
+        return buckets.view(np.int64)
+
+
+def similarities(signature, others):
+    """Estimated Jaccard similarity of one title to each title behind the rows of others"""
+    return np.count_nonzero(others == signature, axis=1) / len(signature)
+
+
+def _date_window(sold_date, days):
+    """ISO bounds of sold dates within `days` of sold_date, or None if it is not a date"""
+    try:
+        sold = date.fromisoformat(str(sold_date)[:10])
+    except ValueError:
+        return None
+    return (sold - timedelta(days=days)).isoformat(), (sold + timedelta(days=days)).isoformat()
+
+
+class DuplicateIndex:
+    """SQLite-backed MinHash/LSH index assigning listings to duplicate clusters"""
+
+    def __init__(self, path=DEFAULT_DUPLICATE_INDEX_PATH, threshold=0.9, price_tolerance=0.0, max_days=3,
+                 bucket_limit=16, max_candidates=50, num_perm=NUM_PERM, bands=BANDS):
+        self.path = path
+        self.threshold = threshold
+        self.price_tolerance = price_tolerance
+        self.max_days = max_days
+        self.bucket_limit = bucket_limit
+        self.max_candidates = max_candidates
+        self.hasher = MinHasher(num_perm, bands)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS listings (
+                id INTEGER PRIMARY KEY,
+                item_key TEXT NOT NULL UNIQUE,
+                cluster_id INTEGER NOT NULL,
+                product_key TEXT,
+                color TEXT,
+                price REAL,
+                sold_date TEXT,
+                signature BLOB NOT NULL,
+                condition TEXT,
+                shipping REAL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                bucket INTEGER NOT NULL,
+                listing_id INTEGER NOT NULL,
+                PRIMARY KEY (bucket, listing_id)
+            ) WITHOUT ROWID;
+        ''')
+        # Indexes built before condition and shipping were compared lack the columns
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(listings)')}
+        for column, kind in (('condition', 'TEXT'), ('shipping', 'REAL')):
+            if column not in columns:
+                self.db.execute(f'ALTER TABLE listings ADD COLUMN {column} {kind}')
+        self._check_parameters()
+        self.db.commit()
+
+        # Newest listings of each of the record's buckets, ranked by how many bands they share.
+        # Each bucket contributes at most bucket_limit rows, so crowded buckets stay cheap.
+        bucket_scans = ' UNION ALL '.join(
+            ['SELECT * FROM (SELECT listing_id FROM buckets WHERE bucket = ? ORDER BY listing_id DESC LIMIT ?)']
+            * bands
+        )
+        self.candidates_sql = f'''
+            SELECT listings.cluster_id, listings.signature
+            FROM (SELECT listing_id, COUNT(*) AS shared FROM ({bucket_scans}) GROUP BY listing_id) AS candidates
+            JOIN listings ON listings.id = candidates.listing_id
+            WHERE (? IS NULL OR listings.product_key IS NULL OR listings.product_key = ?)
+              AND (? IS NULL OR listings.color IS NULL OR listings.color = ?)
+              AND (? IS NULL OR listings.condition IS NULL OR listings.condition = ?)
+              AND (? IS NULL OR listings.shipping IS NULL OR listings.shipping = ?)
+              AND (? IS NULL OR listings.price IS NULL OR listings.price BETWEEN ? AND ?)
+              AND (? IS NULL OR listings.sold_date IS NULL OR listings.sold_date BETWEEN ? AND ?)
+            ORDER BY candidates.shared DESC, listings.id DESC
+            LIMIT ?
+        '''
+
+    def _check_parameters(self):
+        """Signatures are only comparable with the hashing parameters they were built with"""
+        parameters = {'num_perm': self.hasher.num_perm, 'bands': self.hasher.bands,
+                      'shingle_size': SHINGLE_SIZE, 'seed': SEED}
+        stored = dict(self.db.execute('SELECT name, value FROM meta').fetchall())
+        if not stored:
+            self.db.executemany('INSERT INTO meta (name, value) VALUES (?, ?)',
+                                [(name, str(value)) for name, value in parameters.items()])
+            return
+        for name, value in parameters.items():
+            if stored.get(name) != str(value):
+                raise ValueError(f"{self.path} was built with {name}={stored.get(name)}, not {value}")
+
+    def _match(self, record, signature, buckets):
+        """Cluster of the most similar indexed listing that passes every check, or None"""
+        product_key = record.get('product_key')
+        color = record.get('color') or None
+        condition = record.get('condition') or None
+        shipping = record.get('shipping')
+        price = record.get('price')
+        # |price - other| <= tolerance * max(price, other)
+        low, high = (price * (1 - self.price_tolerance), price / (1 - self.price_tolerance)) if price else (None, None)
+        window = _date_window(record['sold_date'], self.max_days) if record.get('sold_date') else None
+        first_day, last_day = window or (None, None)
+
+        parameters = []
+        for bucket in buckets.tolist():
+            parameters += [bucket, self.bucket_limit]
+        parameters += [product_key, product_key, color, color, condition, condition, shipping, shipping,
+                       low, low, high, first_day, first_day, last_day, self.max_candidates]
+        candidates = self.db.execute(self.candidates_sql, parameters).fetchall()
+        if not candidates:
+            return None
+
+        others = np.frombuffer(b''.join(row[1] for row in candidates), dtype=np.uint32)
+        scores = similarities(signature, others.reshape(len(candidates), -1))
+        best = int(scores.argmax())
+        return candidates[best][0] if scores[best] >= self.threshold else None
+
+    def add(self, records):
+        """Index records; returns (cluster_id, is_duplicate, was_indexed) for each one, in order
+
+        A record is identified by its item id or URL, or without either by its
+        title, price and sold date. Records that were indexed before get their
+        stored cluster back with was_indexed set, so callers can skip listings
+        they have already counted.
+        """
+        records = list(records)
+        signatures = self.hasher.signatures([record.get('name') for record in records])
+        all_buckets = self.hasher.buckets(signatures)
+        results = []
+        with self.lock:
+            for record, signature, buckets in zip(records, signatures, all_buckets):
+                item_key = str(record.get('item_id') or record.get('url')
+                               or (record.get('name'), record.get('price'), record.get('sold_date')))
+                row = self.db.execute('SELECT id, cluster_id FROM listings WHERE item_key = ?', (item_key,)).fetchone()
+                if row is not None:
+                    results.append((row[1], row[0] != row[1], True))
+                    continue
+
+                cluster_id = self._match(record, signature, buckets)
+                listing_id = self.db.execute(
+                    'INSERT INTO listings (item_key, cluster_id, product_key, color, price, sold_date, signature, '
+                    'condition, shipping) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (item_key, cluster_id or 0, record.get('product_key'), record.get('color') or None,
+                     record.get('price'), record.get('sold_date'), signature.tobytes(),
+                     record.get('condition') or None, record.get('shipping')),
+                ).lastrowid
+                if cluster_id is None:
+                    # A new cluster is named after its first listing
+                    cluster_id = listing_id
+                    self.db.execute('UPDATE listings SET cluster_id = ? WHERE id = ?', (listing_id, listing_id))
+                self.db.executemany('INSERT OR IGNORE INTO buckets (bucket, listing_id) VALUES (?, ?)',
+                                    [(bucket, listing_id) for bucket in buckets.tolist()])
+                results.append((cluster_id, cluster_id != listing_id, False))
+            self.db.commit()
+        return results
+
+    def count(self):
+        """(listings, clusters) in the index"""
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*), COUNT(DISTINCT cluster_id) FROM listings').fetchone()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def _records(chunk):
+    """Plain dicts from a CSV chunk, with NaN turned into None"""
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.to_dict('records')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assign product keys and duplicate clusters to saved CSV results")
+    parser.add_argument('csv_files', nargs='+', help="CSV files written by the scraper")
+    parser.add_argument('--index', default=DEFAULT_DUPLICATE_INDEX_PATH, help="SQLite duplicate index to add to")
+    parser.add_argument('--device-type', help="device type for --price-stats (default: from the file name)")
+    parser.add_argument('--price-stats', metavar='FILE',
+                        help="also fold the listings that are neither duplicates nor already indexed "
+                             "into these price statistics")
+    parser.add_argument('--chunk-size', type=int, default=50000, help="rows read and indexed at a time")
+    args = parser.parse_args(argv)
+
+    import os
+
+    import pandas as pd
+
+    from price_stats import PriceStatsStore
+    from product_key import product_keys
+
+    index = DuplicateIndex(args.index)
+    price_stats = PriceStatsStore.load(args.price_stats) if args.price_stats else None
+    try:
+        for path in args.csv_files:
+            device_type = args.device_type or os.path.basename(path).split('_sold_items')[0]
+            root, extension = os.path.splitext(path)
+            output = f"{root}_clusters{extension}"
+            rows = duplicates = 0
+            # Stream the file so memory stays flat however many rows it has
+            for number, chunk in enumerate(pd.read_csv(path, chunksize=args.chunk_size)):
+                chunk['product_key'] = product_keys(chunk)
+                records = _records(chunk)
+                clusters = index.add(records)
+                chunk['cluster_id'] = [cluster_id for cluster_id, _, _ in clusters]
+                chunk['duplicate'] = [duplicate for _, duplicate, _ in clusters]
+                chunk.to_csv(output, mode='w' if number == 0 else 'a', header=number == 0, index=False)
+                if price_stats is not None:
+                    # Rows from an earlier backfill are already in the statistics
+                    price_stats.update(device_type, [
+                        record for record, (_, duplicate, indexed) in zip(records, clusters)
+                        if not duplicate and not indexed
+                    ])
+                rows += len(chunk)
+                duplicates += int(chunk['duplicate'].sum())
+            print(f"{path}: {rows} rows, {duplicates} near-duplicates, written to {output}")
+        listings, clusters = index.count()
+        print(f"Index {args.index}: {listings} listings in {clusters} clusters")
+        if price_stats is not None:
+            price_stats.save(args.price_stats)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,29 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import time
-import re
-import sys
-import os
-import platform
-from csv_utils import save_to_csv
+import argparse
+from contextlib import contextmanager, nullcontext
+from functools import partial
+# pandas, BeautifulSoup, requests, selenium, pyarrow and numpy are imported where
+# they are used, so importing this module (or the URL / parsing helpers
+# it re-exports) stays fast
+from csv_utils import append_to_csv, save_to_csv
+from driver_pool import DriverPool
+from fetchers import FallbackFetcher, HttpFetcher, SeleniumFetcher
+from item_index import DEFAULT_INDEX_PATH, ItemIndex, query_key
+from listing_parser import extract_price, extract_attributes, parse_listing_page
+from metrics import METRICS, MemorySampler, profiled
+from pipeline import ScrapePipeline
+from price_stats import PriceStatsStore
+from response_cache import DEFAULT_CACHE_DIR, CachingFetcher, ResponseCache
+from search_url import DEFAULT_BASE_URL, ITEMS_PER_PAGE, SORT_RECENTLY_ENDED, build_search_url
 
 class EbayElectronicsScraper:
-    def __init__(self):
-        self.base_url = "https://www.ebay.com"
-        self.setup_driver()
-        
-    def setup_driver(self):
-        """Set up Chrome driver with appropriate options"""
-        try:
-            options = uc.ChromeOptions()
-            options.add_argument("--headless")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            
-            # Create undetected Chrome driver
-            self.driver = uc.Chrome(
-                options=options,
-                driver_executable_path=None,  # Will be downloaded automatically
-                browser_executable_path=None,  # Will use system Chrome
-            )
-            
-            # Set window size for headless mode
-            self.driver.set_window_size(1920, 1080)
-        except Exception as e:
-            print(f"Error setting up Chrome driver: {str(e)}")
-            sys.exit(1)
+    def __init__(self, fetcher=None, base_url=DEFAULT_BASE_URL):
+        self.base_url = base_url
+        # Plain HTTP by default; Chrome is only started if a page needs it
+        self.fetcher = fetcher or FallbackFetcher()
+        # Queue depths and stage throughput of the last scrape_sold_items run
+        self.pipeline_stats = None
+        # Price statistics of the items collected by the last run
+        self.price_stats = None
 
     def get_device_filters(self, device_type):
         """Return appropriate filters based on device type"""
@@ -62,18 +49,15 @@ class EbayElectronicsScraper:
 
     def get_available_filters(self, device_type):
         """Scrape available filter options from eBay search page"""
+        from bs4 import BeautifulSoup
+        
         try:
             # Search URL without filters
             url = f"{self.base_url}/sch/i.html?_nkw={device_type.replace(' ', '+')}&rt=nc"
-            self.driver.get(url)
-            
-            # Wait for filters to load
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "x-refine__left__nav"))
-            )
-            
-            time.sleep(2)  # Give extra time for filters to load
-            soup = BeautifulSoup(self.driver.page_source, 'html.parser')
+            # Wait for filters to load (in Chrome, until the options stop changing)
+            html = self.fetcher.fetch(url, wait_for="x-refine__left__nav",
+                                      count_selector=".x-refine__multi-select-label")
+            soup = BeautifulSoup(html, 'html.parser')
             
             filter_options = {
                 'color': [],
@@ -104,6 +88,7 @@ class EbayElectronicsScraper:
             return filter_options
             
         except Exception as e:
+            METRICS.error('filters', e)
             print(f"Error scraping filters: {str(e)}")
             return None
 
@@ -121,7 +106,11 @@ class EbayElectronicsScraper:
         
         if not available_filters:
             print("Could not fetch filter options. Using basic filters.")
-            return super().prompt_for_filters(device_type)
+            available_filters = {
+                'color': [],
+                'storage': [],
+                'condition': self.get_condition_options()
+            }
         
         print(f"\nPlease select from the available options for your {device_type}:")
         print("(For multiple selections, enter numbers separated by commas, e.g., '1,3,4')")
@@ -187,195 +176,335 @@ class EbayElectronicsScraper:
         
         return filter_values
 
-    def build_search_url(self, device_type, filters):
-        """Build eBay search URL with filters"""
-        # Construct the base search query
-        search_terms = [device_type]
-        
-        # Add non-condition filter values to search terms
-        for filter_type, values in filters.items():
-            if filter_type != 'condition' and values:
-                if isinstance(values, list):
-                    search_terms.extend(values)
-                else:
-                    search_terms.append(values)
-        
-        # Join all search terms
-        search_query = " ".join(search_terms).replace(" ", "+")
-        
-        # Build the URL with proper eBay parameters
-        url = f"{self.base_url}/sch/i.html"
-        url += f"?_nkw={search_query}"
-        url += "&LH_Sold=1"  # Show sold items
-        url += "&LH_Complete=1"  # Show completed items
-        url += "&rt=nc"  # No category constraints
-        
-        # Add condition parameters if present
-        if 'condition' in filters and filters['condition']:
-            condition_params = []
-            for condition in filters['condition']:
-                if condition == 'New':
-                    condition_params.append("1000")
-                elif condition == 'Open Box':
-                    condition_params.append("1500")
-                elif condition == 'Certified Refurbished':
-                    condition_params.append("2000")
-                elif condition == 'Seller Refurbished':
-                    condition_params.append("2500")
-                elif condition == 'Pre-owned':
-                    condition_params.append("3000")
-                elif condition == 'For Parts or Not Working':
-                    condition_params.append("7000")
-            
-            if condition_params:
-                url += f"&LH_ItemCondition={'|'.join(condition_params)}"
-        
-        return url
+    def build_search_url(self, device_type, filters, page=None, per_page=None, sort=None):
+        """Build eBay search URL with filters, optionally for a given results page"""
+        return build_search_url(device_type, filters, page, per_page, sort, base_url=self.base_url)
 
     def extract_price(self, price_text):
         """Extract numerical price from price text"""
-        if not price_text:
-            return None
-        price_match = re.search(r'\$?([\d,]+\.?\d*)', price_text)
-        if price_match:
-            return float(price_match.group(1).replace(',', ''))
-        return None
+        return extract_price(price_text)
 
-    def extract_attributes(self, description):
+    def extract_attributes(self, description, device_type=None):
         """Extract relevant attributes from item description"""
-        attributes = {}
+        return extract_attributes(description, device_type)
+
+    def fetch_page(self, url):
+        """Fetch one results page"""
+        # Wait for the items to load (and scroll to load more in Chrome)
+        return self.fetcher.fetch(url, wait_for="s-item__title", scroll=True, count_selector=".s-item")
+
+    def scrape_sold_items(self, device_type, filters=None, max_pages=10, max_items=None, workers=4,
+                          parse_workers=None, index=None, store=None, parse_executor=None, price_stats=None,
+                          duplicates=None, raise_errors=False):
+        """Scrape eBay for sold items matching the criteria
         
-        # Common patterns to look for
-        storage_pattern = r'(\d+)\s*(GB|TB)'
-        color_pattern = r'(Black|White|Gold|Silver|Gray|Rose Gold|Blue|Red)'
-        condition_pattern = r'(New|Open Box|Certified Refurbished|Seller Refurbished|Pre-owned|For Parts or Not Working)'
+        Up to `workers` result pages are fetched at a time while a pool of
+        `parse_workers` processes (or the shared `parse_executor`) parses the
+        pages already downloaded. Pages are collected in page order whatever
+        order they finish in, so the items kept under max_items and the
+        page where crawling stops are the same as in a one-page-at-a-time crawl.
+        Crawling stops at max_pages, once max_items have been collected, or
+        as soon as a page adds no items that were not already seen. A page
+        that fails to fetch or parse stops the crawl and fails the run
+        without saving anything: the pages after it were never collected, and
+        an incremental run that indexed the pages before it would stop there
+        next time and never collect them.
         
-        # Extract storage
-        storage_match = re.search(storage_pattern, description, re.IGNORECASE)
-        if storage_match:
-            attributes['storage'] = storage_match.group()
-            
-        # Extract color
-        color_match = re.search(color_pattern, description, re.IGNORECASE)
-        if color_match:
-            attributes['color'] = color_match.group(1)
-            
-        # Extract condition
-        condition_match = re.search(condition_pattern, description, re.IGNORECASE)
-        if condition_match:
-            attributes['condition'] = condition_match.group(1)
-            
-        return attributes
-
-    def scrape_sold_items(self, device_type, filters=None):
-        """Scrape eBay for sold items matching the criteria"""
+        With an ItemIndex the run is incremental: results are sorted most
+        recently sold first, listings already in the index are dropped,
+        crawling stops at the first page that reaches them, and only the
+        new rows are appended to the device's CSV file. Page 1 is fetched
+        on its own before the other workers start, so a poll with nothing
+        new fetches a single page.
+        
+        With a ResultsStore the rows are written there as Parquet instead of
+        to a CSV file.
+        
+        With a DuplicateIndex every row gets the cluster_id of the listings
+        it near-duplicates (relists and copies of the same sale), and only
+        the first listing of each cluster counts towards the price statistics,
+        once: listings the index already holds are not counted again.
+        
+        Price statistics are updated as each page is collected. With a
+        PriceStatsStore, this run's statistics are merged into it once the
+        rows are saved. That needs an index (ItemIndex or DuplicateIndex)
+        to tell which sales earlier runs already counted, so the same sold
+        listings are not added again every time a query is polled.
+        
+        Errors are printed and an empty DataFrame is returned, unless
+        raise_errors is set (batch runs), in which case they propagate.
+        """
+        import pandas as pd
+        
+        if price_stats is not None and index is None and duplicates is None:
+            raise ValueError("price_stats needs an index or duplicates so repeated runs do not recount sales")
         if filters is None:
             filters = {}
             
         search_url = self.build_search_url(device_type, filters)
         print(f"\nSearching URL: {search_url}")
+        search_key = query_key(search_url)
+        sort = SORT_RECENTLY_ENDED if index is not None else None
         
         try:
-            self.driver.get(search_url)
-            
-            # Wait for the items to load
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "s-item__title"))
-            )
-            
-            # Scroll to load more items
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(3)
-            
-            soup = BeautifulSoup(self.driver.page_source, 'html.parser')
+            results = []
+            seen = set()
+            failed_pages = []
+            run_stats = PriceStatsStore()
+            self.price_stats = run_stats
             
-            # Try different item selectors
-            items = soup.find_all('div', class_='s-item__info clearfix')
-            if not items:
-                items = soup.find_all('div', class_='s-item__info')
-            if not items:
-                items = soup.find_all('li', class_='s-item')
+            def collect(page_number, items):
+                """Keep unseen items; returning False stops the crawl"""
+                if items is None:
+                    # Not the end of the results: the page could not be read
+                    failed_pages.append(page_number)
+                    return False
+                known = set()
+                if index is not None:
+                    known = index.known_ids(search_key, [item_data.get('item_id') for item_data in items])
                 
-            print(f"\nFound {len(items)} items")
-            
-            results = []
-            for item in items:
-                if item is None:
-                    continue
-                    
-                title_elem = item.find('span', class_='s-item__title') or item.find('div', class_='s-item__title')
-                price_elem = item.find('span', class_='s-item__price') or item.find('div', class_='s-item__price')
+                new_items = []
+                for item_data in items:
+                    if item_data.get('item_id') in known:
+                        continue
+                    # Listing link identifies repeats across pages
+                    key = item_data.get('url') or (item_data['name'], item_data['price'])
+                    if key not in seen:
+                        seen.add(key)
+                        new_items.append(item_data)
+                if max_items:
+                    new_items = new_items[:max(max_items - len(results), 0)]
                 
-                if not title_elem or not price_elem:
-                    continue
-                    
-                title = title_elem.text.strip()
-                if title.lower() == 'shop on ebay':
-                    continue
-                    
-                price = self.extract_price(price_elem.text.strip())
+                counted = new_items
+                note = ""
+                if duplicates is not None:
+                    clusters = duplicates.add(new_items)
+                    for item_data, (cluster_id, _, _) in zip(new_items, clusters):
+                        item_data['cluster_id'] = cluster_id
+                    # Listings indexed by an earlier run were counted then
+                    counted = [item_data for item_data, (_, duplicate, indexed) in zip(new_items, clusters)
+                               if not duplicate and not indexed]
+                    near_duplicates = sum(duplicate and not indexed for _, duplicate, indexed in clusters)
+                    seen_before = sum(indexed for _, _, indexed in clusters)
+                    METRICS.count('near_duplicates', near_duplicates)
+                    note = f" ({near_duplicates} near-duplicates, {seen_before} seen by earlier runs)"
                 
-                if title and price:
-                    item_data = {
-                        'name': title,
-                        'price': price,
-                        **self.extract_attributes(title)
-                    }
-                    results.append(item_data)
+                print(f"Page {page_number}: found {len(items)} items, {len(new_items)} new{note}")
+                results.extend(new_items)
+                run_stats.update(device_type, counted)
+                if known:
+                    print(f"Page {page_number} reached {len(known)} already indexed items")
+                    return False
+                if not new_items:
+                    return False
+                if max_items and len(results) >= max_items:
+                    return False
+                return True
+            
+            # Pages are handed out lazily, so stopping early skips the rest
+            jobs = (
+                (n, self.build_search_url(device_type, filters, page=n, per_page=ITEMS_PER_PAGE, sort=sort))
+                for n in range(1, max_pages + 1)
+            )
+            pipeline = ScrapePipeline(
+                # partial of a module-level function still pickles for the parser processes
+                self.fetch_page, partial(parse_listing_page, device_type=device_type), collect,
+                fetch_workers=workers, parse_workers=parse_workers, executor=parse_executor,
+                # A poll usually finds known items on page 1, so only fetch more once it has not
+                lead_pages=1 if index is not None else 0,
+            )
+            self.pipeline_stats = pipeline.run(jobs)
+            if failed_pages:
+                raise RuntimeError(f"page {failed_pages[0]} could not be fetched or parsed; "
+                                   f"nothing from this run was saved")
             
-            df = pd.DataFrame(results)
+            if max_items:
+                results = results[:max_items]
+            print(f"\nFound {len(results)} items")
+            with METRICS.timer('dataframe_build'):
+                df = pd.DataFrame(results)
             
             if len(df) > 0:
-                # Calculate statistics for the last 30 items
-                recent_df = df.head(30)
-                stats = {
-                    'count': len(recent_df),
-                    'average_price': round(recent_df['price'].mean(), 2),
-                    'min_price': round(recent_df['price'].min(), 2),
-                    'max_price': round(recent_df['price'].max(), 2)
-                }
+                stats = run_stats.summary(device_type)
+                # Empty when every row is a near-duplicate of an earlier listing
+                if stats['count']:
+                    print(f"\nPrice Statistics ({stats['count']} Sales):")
+                    print(f"Average Price: ${stats['mean']} (std dev ${stats['stddev']})")
+                    print(f"Median Price: ${stats['median']} (p10 ${stats['p10']}, p90 ${stats['p90']})")
+                    print(f"Price Range: ${stats['min']} - ${stats['max']}")
+                else:
+                    print("\nNo new sales for the price statistics (every row is a near-duplicate or already counted)")
                 
-                print("\nPrice Statistics (Last 30 Sales):")
-                print(f"Number of items analyzed: {stats['count']}")
-                print(f"Average Price: ${stats['average_price']}")
-                print(f"Price Range: ${stats['min_price']} - ${stats['max_price']}")
+                with METRICS.timer('save_results'):
+                    if store is not None:
+                        store.write(df, device_type)
+                    elif index is not None:
+                        append_to_csv(df, device_type)
+                    else:
+                        # Save full results to CSV
+                        save_to_csv(df, device_type, filters)
                 
-                # Save full results to CSV
-                save_to_csv(df, device_type, filters)
+                if index is not None:
+                    # Only new rows reach this point; index them once they are saved
+                    index.add(search_key, results)
+                if price_stats is not None:
+                    price_stats.merge(run_stats)
                 
             return df
             
         except Exception as e:
+            METRICS.error('scrape', e)
             print(f"Error during scraping: {str(e)}")
+            if raise_errors:
+                raise
             return pd.DataFrame()
 
     def close(self):
-        """Close the browser"""
+        """Close the HTTP session and the browser, if one was started"""
         try:
-            if self.driver:
-                self.driver.quit()
+            self.fetcher.close()
         except:
             pass
 
-def main():
-    scraper = EbayElectronicsScraper()
+def build_fetcher(args, pool_size=10):
+    """Create the page fetcher described by the command line options"""
+    if args.replay:
+        # Replay never touches the network, so no HTTP session or browser is needed
+        return CachingFetcher(None, ResponseCache(args.cache_dir), replay=True)
+    
+    browsers = DriverPool(
+        size=args.browsers or 1,
+        max_pages=args.browser_max_pages,
+        max_memory_mb=args.browser_max_memory,
+        block_resources=not args.load_all_resources,
+    )
+    if args.browsers:
+        # Asked for a pool: start it now so escalated pages do not wait for Chrome
+        browsers.warm()
+    fetcher = FallbackFetcher(HttpFetcher(pool_size=pool_size), SeleniumFetcher(browsers, timeout=args.page_timeout))
+    if args.no_cache:
+        return fetcher
+    return CachingFetcher(fetcher, ResponseCache(args.cache_dir))
+
+def add_run_arguments(parser):
+    """Add the fetching and output options shared by the interactive and batch CLIs"""
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="directory for the on-disk response cache")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always fetch pages from eBay and do not cache them")
+    parser.add_argument('--replay', action='store_true',
+                        help="serve pages only from the response cache, without touching the network")
+    parser.add_argument('--browsers', type=int,
+                        help="start this many headless Chrome instances up front and keep them for pages that need "
+                             "a browser (default: one, started the first time a page needs it)")
+    parser.add_argument('--browser-max-pages', type=int, default=50,
+                        help="restart a browser after this many pages")
+    parser.add_argument('--browser-max-memory', type=int, default=1024, metavar='MB',
+                        help="restart a browser once it uses more memory than this")
+    parser.add_argument('--load-all-resources', action='store_true',
+                        help="let the browser load images, fonts, stylesheets and tracking scripts")
+    parser.add_argument('--page-timeout', type=float, default=10, metavar='SECONDS',
+                        help="longest a browser waits for a page to settle")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only collect listings not seen by earlier runs and append them to one CSV per device")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH,
+                        help="SQLite file that records already collected listings (used with --incremental)")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="group near-duplicate listings into clusters and count each cluster once in the statistics")
+    parser.add_argument('--duplicate-index', metavar='FILE',
+                        help="SQLite file of listing signatures used to find near-duplicates "
+                             "(used with --dedupe, default duplicate_index.sqlite)")
+    parser.add_argument('--store', metavar='DIR',
+                        help="save results as Parquet in this results store instead of CSV files")
+    parser.add_argument('--price-stats', metavar='FILE',
+                        help="keep running price statistics per storage, color and condition in this file "
+                             "(needs --incremental or --dedupe)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write stage timings, page sizes, error counts and peak memory to FILE at the end "
+                             "(Prometheus text format if it ends in .prom, otherwise appended as JSON lines)")
+    parser.add_argument('--profile', nargs='?', const='scrape.prof', metavar='FILE',
+                        help="run the scrape under cProfile and save the stats (default scrape.prof)")
+
+def open_store(args):
+    """ResultsStore for --store, if given (pyarrow is only loaded then)"""
+    if not args.store:
+        return None
+    from results_store import ResultsStore
+    return ResultsStore(args.store)
+
+def open_duplicates(args):
+    """DuplicateIndex for --dedupe, if given (numpy is only loaded then)"""
+    if not args.dedupe:
+        return None
+    from duplicate_index import DEFAULT_DUPLICATE_INDEX_PATH, DuplicateIndex
+    return DuplicateIndex(args.duplicate_index or DEFAULT_DUPLICATE_INDEX_PATH)
+
+@contextmanager
+def instrument_run(args, run):
+    """Sample peak memory during a CLI run and write --metrics once it ends"""
+    try:
+        with MemorySampler():
+            yield
+    finally:
+        if args.metrics:
+            METRICS.write(args.metrics, run=run)
+            print(f"\nRun metrics (written to {args.metrics}):")
+            print(METRICS.report())
+
+def check_run_arguments(parser, args):
+    if args.replay and args.no_cache:
+        parser.error("--replay needs the cache, so it cannot be combined with --no-cache")
+    if args.price_stats and not (args.incremental or args.dedupe):
+        parser.error("--price-stats needs --incremental or --dedupe, "
+                     "otherwise every run adds the same sold listings again")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape recently sold electronics from eBay")
+    add_run_arguments(parser)
+    args = parser.parse_args(argv)
+    check_run_arguments(parser, args)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    scraper = EbayElectronicsScraper(fetcher=build_fetcher(args))
+    index = ItemIndex(args.index) if args.incremental else None
+    store = open_store(args)
+    duplicates = open_duplicates(args)
+    price_stats = PriceStatsStore.load(args.price_stats) if args.price_stats else None
     
     try:
-        # Get device type from user
-        device_type = input("Enter the electronic device type (e.g., phone, laptop, tablet): ").strip()
-        
-        # Get filters from user
-        filters = scraper.prompt_for_filters(device_type)
-        
-        # Scrape data
-        print("\nScraping eBay for sold items... This may take a moment.")
-        df = scraper.scrape_sold_items(device_type, filters)
-        
-        if len(df) == 0:
-            print("No results found matching your criteria.")
+        with instrument_run(args, 'interactive'):
+            # Get device type from user
+            device_type = input("Enter the electronic device type (e.g., phone, laptop, tablet): ").strip()
+            
+            # Get filters from user
+            filters = scraper.prompt_for_filters(device_type)
+            
+            # Scrape data
+            print("\nScraping eBay for sold items... This may take a moment.")
+            with profiled(args.profile) if args.profile else nullcontext():
+                df = scraper.scrape_sold_items(device_type, filters, index=index, store=store,
+                                               price_stats=price_stats, duplicates=duplicates)
+            
+            if len(df) == 0:
+                if index is not None:
+                    print("No new sold items since the last run.")
+                else:
+                    print("No results found matching your criteria.")
+            
+            if isinstance(scraper.fetcher, CachingFetcher):
+                print(f"\nResponse cache: {scraper.fetcher.cache.stats()}")
+            
+            if price_stats is not None:
+                price_stats.save(args.price_stats)
             
     finally:
         scraper.close()
+        if index is not None:
+            index.close()
+        if duplicates is not None:
+            duplicates.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,195 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+# requests and selenium are imported by the fetchers that use them, so
+# helpers such as looks_blocked() stay cheap to import
+from metrics import METRICS
+from page_ready import wait_until_stable
+
+# Headers a regular desktop browser would send; eBay serves the full result
+# markup to these without needing JavaScript
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# Text that shows up on eBay's bot-check / captcha interstitials
+CHALLENGE_MARKERS = (
+    'pardon our interruption',
+    'checking your browser',
+    'please verify yourself',
+    'captcha',
+    'splashui/challenge',
+)
+
+
+def looks_blocked(html):
+    """Return True if the page looks like a bot challenge instead of content"""
+    if not html:
+        return True
+    lowered = html.lower()
+    return any(marker in lowered for marker in CHALLENGE_MARKERS)
+
+
+def needs_browser(html, required_class=None):
+    """Return True if a plain HTTP response is not good enough to parse"""
+    if looks_blocked(html):
+        return True
+    return bool(required_class) and required_class not in html
+
+
+class HostRateLimiter:
+    """Space out requests to the same host by at least min_interval seconds"""
+
+    def __init__(self, min_interval=0.25):
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HttpFetcher:
+    """Fetch pages over a pooled keep-alive requests.Session"""
+
+    def __init__(self, pool_size=10, retries=3, backoff=0.5, timeout=15, headers=None, rate_limiter=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url, wait_for=None, **browser_options):
+        """Return the HTML for url; browser-only options are ignored"""
+        self.rate_limiter.wait(url)
+        with METRICS.timer('http_get'):
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        METRICS.observe('page_bytes', len(response.content), source='http')
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+
+class SeleniumFetcher:
+    """Fetch pages with headless Chrome drivers borrowed from a DriverPool
+
+    Instead of fixed sleeps, each page is read as soon as it is ready (see
+    page_ready.py); each wait is recorded in METRICS as page_ready_seconds,
+    split by whether the page settled or timed out, for tuning the timeout.
+    """
+
+    def __init__(self, pool=None, timeout=10, poll_interval=0.25, stable_polls=2, quiet_period=0.5):
+        if pool is None:
+            from driver_pool import DriverPool
+
+            # A single driver unless a bigger pool is shared in
+            pool = DriverPool(size=1)
+        self.pool = pool
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.quiet_period = quiet_period
+
+    def fetch(self, url, wait_for=None, scroll=False, count_selector=None):
+        """Load url in Chrome and return the rendered page source once it has settled"""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with self.pool.driver() as driver:
+            with METRICS.timer('driver_get'):
+                driver.get(url)
+            started = time.monotonic()
+
+            with METRICS.timer('page_wait'):
+                if wait_for:
+                    WebDriverWait(driver, self.timeout, poll_frequency=self.poll_interval).until(
+                        EC.presence_of_element_located((By.CLASS_NAME, wait_for))
+                    )
+
+                if scroll:
+                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+
+                selector = count_selector or (f".{wait_for}" if wait_for else "body *")
+                remaining = max(self.timeout - (time.monotonic() - started), 0)
+                _, count, timed_out = wait_until_stable(
+                    driver, selector,
+                    timeout=remaining,
+                    poll_interval=self.poll_interval,
+                    stable_polls=self.stable_polls,
+                    quiet_period=self.quiet_period,
+                )
+            METRICS.observe('page_ready_seconds', time.monotonic() - started,
+                            outcome='timed_out' if timed_out else 'settled')
+            if timed_out:
+                METRICS.count('page_wait_timeouts')
+
+            html = driver.page_source
+            METRICS.observe('page_bytes', len(html.encode('utf-8')), source='browser')
+            return html
+
+    def close(self):
+        self.pool.close()
+
+
+class FallbackFetcher:
+    """Try plain HTTP first and only escalate to Chrome when the page needs it"""
+
+    def __init__(self, primary=None, fallback=None):
+        self.primary = primary or HttpFetcher()
+        self.fallback = fallback
+        self.escalations = 0
+        self.lock = threading.Lock()
+
+    def fetch(self, url, wait_for=None, **browser_options):
+        from requests import RequestException
+
+        html = None
+        try:
+            html = self.primary.fetch(url, wait_for=wait_for)
+        except RequestException as e:
+            print(f"HTTP fetch failed, falling back to browser: {str(e)}")
+
+        if html is not None and not needs_browser(html, wait_for):
+            return html
+
+        METRICS.count('browser_escalations')
+        with self.lock:
+            self.escalations += 1
+            if self.fallback is None:
+                self.fallback = SeleniumFetcher()
+        return self.fallback.fetch(url, wait_for=wait_for, **browser_options)
+
+    def close(self):
+        self.primary.close()
+        if self.fallback is not None:
+            self.fallback.close()
@@ -0,0 +1,92 @@
+"""Persistent record of the eBay listings each query has already collected.
+
+Used by incremental scrapes: a run stops paginating once it reaches
+listings that are already indexed and only keeps the new ones.
+"""
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from response_cache import normalize_url
+
+DEFAULT_INDEX_PATH = 'item_index.sqlite'
+
+# Page number, items per page and sort order do not change which listings match
+PAGING_PARAMS = ('_pgn', '_ipg', '_sop')
+
+
+def query_key(search_url):
+    """Identify a search independently of paging, sorting and parameter order"""
+    parts = urlsplit(search_url)
+    query = [(name, value) for name, value in parse_qsl(parts.query) if name not in PAGING_PARAMS]
+    return normalize_url(urlunsplit(parts._replace(query=urlencode(query))))
+
+
+class ItemIndex:
+    """SQLite-backed set of (query, item id) pairs with their sold dates"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS items (
+                query_key TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                sold_date TEXT,
+                first_seen TEXT NOT NULL,
+                PRIMARY KEY (query_key, item_id)
+            )
+        ''')
+        self.db.commit()
+
+    def known_ids(self, key, item_ids):
+        """Return the subset of item_ids already indexed for this query"""
+        item_ids = [item_id for item_id in item_ids if item_id]
+        if not item_ids:
+            return set()
+        known = set()
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(item_ids), 500):
+                chunk = item_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.db.execute(
+                    f'SELECT item_id FROM items WHERE query_key = ? AND item_id IN ({placeholders})',
+                    [key, *chunk],
+                ).fetchall()
+                known.update(row[0] for row in rows)
+        return known
+
+    def add(self, key, records):
+        """Index the records that have an item id; returns how many were new"""
+        now = datetime.now().isoformat(timespec='seconds')
+        rows = [
+            (key, record['item_id'], record.get('sold_date'), now)
+            for record in records if record.get('item_id')
+        ]
+        with self.lock:
+            before = self.db.total_changes
+            self.db.executemany(
+                'INSERT OR IGNORE INTO items (query_key, item_id, sold_date, first_seen) VALUES (?, ?, ?, ?)',
+                rows,
+            )
+            self.db.commit()
+            return self.db.total_changes - before
+
+    def latest_sold_date(self, key):
+        """Most recent sold date indexed for this query, as an ISO date string"""
+        with self.lock:
+            row = self.db.execute('SELECT MAX(sold_date) FROM items WHERE query_key = ?', (key,)).fetchone()
+        return row[0]
+
+    def count(self, key=None):
+        with self.lock:
+            if key is None:
+                return self.db.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+            return self.db.execute('SELECT COUNT(*) FROM items WHERE query_key = ?', (key,)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
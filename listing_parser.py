@@ -0,0 +1,233 @@
+"""Turn eBay search result HTML into item records.
+
+Everything here is a plain module-level function so it can run inside
+worker processes (see pipeline.py). Pages are parsed with lxml and
+precompiled XPath selectors when lxml is installed; the BeautifulSoup
+parser is kept as a fallback and returns the same records.
+
+lxml and BeautifulSoup are only imported when the first page is parsed,
+so the record helpers (extract_price, extract_attributes, ...) load with
+nothing but the standard library.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+from importlib.util import find_spec
+from types import SimpleNamespace
+
+import attribute_extractor
+from metrics import METRICS
+from product_key import product_key
+
+ITEM_ID_RE = re.compile(r'/itm/(?:[^/?]+/)?(\d{9,15})')
+SOLD_DATE_RE = re.compile(r'([A-Z][a-z]{2})\s+(\d{1,2}),?\s+(\d{4})')
+
+
+def extract_price(price_text):
+    """Extract numerical price from price text"""
+    if not price_text:
+        return None
+    price_match = re.search(r'\$?([\d,]+\.?\d*)', price_text)
+    if price_match:
+        return float(price_match.group(1).replace(',', ''))
+    return None
+
+
+def extract_attributes(description, device_type=None):
+    """Extract relevant attributes from item description"""
+    return attribute_extractor.for_device(device_type).extract(description)
+
+
+def parse_item_id(url):
+    """Pull the numeric listing id out of an /itm/ URL"""
+    if not url:
+        return None
+    id_match = ITEM_ID_RE.search(url)
+    return id_match.group(1) if id_match else None
+
+
+def parse_sold_date(text):
+    """Turn 'Sold  Oct 3, 2023' into '2023-10-03'"""
+    if not text:
+        return None
+    date_match = SOLD_DATE_RE.search(text)
+    if not date_match:
+        return None
+    try:
+        return datetime.strptime(' '.join(date_match.groups()), '%b %d %Y').date().isoformat()
+    except ValueError:
+        return None
+
+
+def parse_shipping(text):
+    """Return the shipping cost, 0.0 for free shipping, or None if not shown"""
+    if not text:
+        return None
+    if 'free' in text.lower():
+        return 0.0
+    return extract_price(text)
+
+
+def build_record(title, price_text, url, sold_text, shipping_text, device_type=None):
+    """Build an item record from the raw text of one listing, or None to skip it
+
+    device_type picks the attribute vocabulary (processor and RAM for
+    laptops, type and resolution for cameras, ...).
+    """
+    title = title.strip() if title else ''
+    if not title or title.lower() == 'shop on ebay':
+        return None
+
+    price = extract_price(price_text.strip()) if price_text else None
+    if not price:
+        return None
+
+    # Listing link without tracking params
+    url = url.split('?')[0] if url else None
+    attributes = extract_attributes(title, device_type)
+    item_data = {
+        'name': title,
+        'price': price,
+        'item_id': parse_item_id(url),
+        'sold_date': parse_sold_date(sold_text),
+        'shipping': parse_shipping(shipping_text),
+        'url': url,
+        **attributes,
+        # Normalization stage: the same product under any wording gets one key
+        'product_key': product_key(title, attributes),
+    }
+    return item_data
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+@lru_cache(maxsize=None)
+def _lxml():
+    """lxml.html and the XPath selectors, compiled once per process on first use"""
+    from lxml import etree
+    from lxml import html as lxml_html
+
+    # Each listing is then read with a few relative lookups
+    return SimpleNamespace(
+        html=lxml_html,
+        info_items=etree.XPath(f"//div[{_has_class('s-item__info')}]"),
+        li_items=etree.XPath(f"//li[{_has_class('s-item')}]"),
+        title=etree.XPath(f".//*[(self::span or self::div) and {_has_class('s-item__title')}]"),
+        price=etree.XPath(f".//*[(self::span or self::div) and {_has_class('s-item__price')}]"),
+        link=etree.XPath(f".//a[{_has_class('s-item__link')}]/@href"),
+        sold=etree.XPath(
+            f".//*[{_has_class('s-item__caption--signal')} or {_has_class('s-item__title--tag')}]"
+        ),
+        shipping=etree.XPath(f".//*[{_has_class('s-item__shipping')}]"),
+    )
+
+
+def _first_text(selector, item):
+    found = selector(item)
+    return found[0].text_content() if found else None
+
+
+def parse_listing_page_lxml(html, device_type=None):
+    """Parse the listing rows out of a search results page with lxml"""
+    if not html or not html.strip():
+        return []
+    lxml = _lxml()
+    with METRICS.timer('parse_html'):
+        root = lxml.html.fromstring(html)
+
+    # Same fallback order as the BeautifulSoup parser
+    items = lxml.info_items(root) or lxml.li_items(root)
+
+    results = []
+    with METRICS.timer('extract_items'):
+        for item in items:
+            title = _first_text(lxml.title, item)
+            price_text = _first_text(lxml.price, item)
+            if not title or not price_text:
+                continue
+
+            links = lxml.link(item)
+            record = build_record(
+                title,
+                price_text,
+                links[0] if links else None,
+                _first_text(lxml.sold, item),
+                _first_text(lxml.shipping, item),
+                device_type,
+            )
+            if record:
+                results.append(record)
+
+    return results
+
+
+def parse_listing_page_bs4(html, device_type=None):
+    """Parse the listing rows out of a search results page with BeautifulSoup"""
+    from bs4 import BeautifulSoup
+
+    with METRICS.timer('parse_html'):
+        soup = BeautifulSoup(html, 'html.parser')
+
+    # Try different item selectors
+    items = soup.find_all('div', class_='s-item__info clearfix')
+    if not items:
+        items = soup.find_all('div', class_='s-item__info')
+    if not items:
+        items = soup.find_all('li', class_='s-item')
+
+    results = []
+    with METRICS.timer('extract_items'):
+        for item in items:
+            if item is None:
+                continue
+
+            title_elem = item.find('span', class_='s-item__title') or item.find('div', class_='s-item__title')
+            price_elem = item.find('span', class_='s-item__price') or item.find('div', class_='s-item__price')
+
+            if not title_elem or not price_elem:
+                continue
+
+            link_elem = item.find('a', class_='s-item__link')
+            sold_elem = item.find(class_='s-item__caption--signal') or item.find(class_='s-item__title--tag')
+            shipping_elem = item.find(class_='s-item__shipping')
+
+            record = build_record(
+                title_elem.text,
+                price_elem.text,
+                link_elem.get('href') if link_elem else None,
+                sold_elem.text if sold_elem else None,
+                shipping_elem.text if shipping_elem else None,
+                device_type,
+            )
+            if record:
+                results.append(record)
+
+    return results
+
+
+PARSERS = {
+    'bs4': parse_listing_page_bs4,
+}
+if find_spec('lxml') is not None:
+    PARSERS['lxml'] = parse_listing_page_lxml
+
+DEFAULT_BACKEND = 'lxml' if 'lxml' in PARSERS else 'bs4'
+
+
+def parse_listing_page(html, backend=None, device_type=None):
+    """Parse the listing rows out of a search results page
+
+    Uses lxml when it is installed and falls back to BeautifulSoup's
+    html.parser if lxml is missing or cannot handle the page. device_type
+    selects the attributes extracted from each title.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend != 'bs4':
+        try:
+            return PARSERS[backend](html, device_type)
+        except Exception as e:
+            METRICS.error(f"parse_{backend}", e)
+            print(f"{backend} parser failed, falling back to BeautifulSoup: {str(e)}")
+    return parse_listing_page_bs4(html, device_type)
@@ -0,0 +1,314 @@
+"""Lightweight timers, counters and memory sampling for the scrape path.
+
+Code is instrumented against the shared METRICS registry:
+
+    with METRICS.timer('http_get'):
+        response = session.get(url)
+    METRICS.observe('page_bytes', len(response.content), source='http')
+
+A timer records how often a stage ran and its total and slowest duration.
+When the block raises, the error is counted by stage and exception type
+before it propagates. Metrics can be written as JSON lines or in the
+Prometheus text format. Work done in parser processes is collected with
+call_with_metrics() and merged back into the parent's registry.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """Thread-safe counters, summaries (count / sum / max) and peak gauges"""
+
+    def __init__(self, prefix='scraper'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.summaries = {}
+        self.gauges = {}
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.summaries.clear()
+            self.gauges.clear()
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add one observation (a duration, a page size, ...) to a summary"""
+        key = _key(name, labels)
+        with self.lock:
+            summary = self.summaries.setdefault(key, [0, 0.0, value])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def peak(self, name, value, **labels):
+        """Keep the largest value seen for a gauge"""
+        key = _key(name, labels)
+        with self.lock:
+            self.gauges[key] = max(self.gauges.get(key, value), value)
+
+    def error(self, stage, exc):
+        self.count('errors', stage=stage, type=type(exc).__name__)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a block as one run of `stage`; errors are counted and re-raised"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(stage, e)
+            raise
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, stage=stage)
+
+    def snapshot(self):
+        """All metrics as a list of JSON-serializable entries"""
+        with self.lock:
+            entries = [
+                {'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self.counters.items()
+            ]
+            entries += [
+                {'type': 'summary', 'name': name, 'labels': dict(labels), 'count': count, 'sum': total, 'max': largest}
+                for (name, labels), (count, total, largest) in self.summaries.items()
+            ]
+            entries += [
+                {'type': 'gauge', 'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self.gauges.items()
+            ]
+        return entries
+
+    def merge(self, entries):
+        """Fold in a snapshot taken elsewhere, e.g. in a parser process"""
+        with self.lock:
+            for entry in entries:
+                key = _key(entry['name'], entry['labels'])
+                if entry['type'] == 'counter':
+                    self.counters[key] = self.counters.get(key, 0) + entry['value']
+                elif entry['type'] == 'summary':
+                    summary = self.summaries.setdefault(key, [0, 0.0, entry['max']])
+                    summary[0] += entry['count']
+                    summary[1] += entry['sum']
+                    summary[2] = max(summary[2], entry['max'])
+                else:
+                    self.gauges[key] = max(self.gauges.get(key, entry['value']), entry['value'])
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        def series(name, labels, value):
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+            return f"{self.prefix}_{name}{{{label_text}}} {value}" if label_text else f"{self.prefix}_{name} {value}"
+
+        families = {}
+        for entry in self.snapshot():
+            name, labels = entry['name'], entry['labels']
+            if entry['type'] == 'counter':
+                families.setdefault((f"{name}_total", 'counter'), []).append(
+                    series(f"{name}_total", labels, entry['value']))
+            elif entry['type'] == 'summary':
+                families.setdefault((name, 'summary'), []).extend([
+                    series(f"{name}_count", labels, entry['count']),
+                    series(f"{name}_sum", labels, round(entry['sum'], 6)),
+                ])
+                families.setdefault((f"{name}_max", 'gauge'), []).append(
+                    series(f"{name}_max", labels, round(entry['max'], 6)))
+            else:
+                families.setdefault((name, 'gauge'), []).append(series(name, labels, entry['value']))
+
+        lines = []
+        for (name, kind), samples in sorted(families.items()):
+            lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+            lines.extend(sorted(samples))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, **run_labels):
+        """Write a .prom text file, or append one JSON line per metric to any other path"""
+        if path.endswith('.prom'):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+            return
+
+        timestamp = time.time()
+        with open(path, 'a') as f:
+            for entry in self.snapshot():
+                f.write(json.dumps({'time': timestamp, **run_labels, **entry}) + '\n')
+
+    def report(self):
+        """Human-readable summary of stage timings, page sizes, errors and peaks"""
+        lines = [f"{'stage':<20}{'runs':>8}{'total s':>10}{'mean s':>10}{'max s':>10}"]
+        entries = self.snapshot()
+        stages = [entry for entry in entries if entry['name'] == 'stage_seconds']
+        for entry in sorted(stages, key=lambda entry: -entry['sum']):
+            lines.append(
+                f"{entry['labels']['stage']:<20}{entry['count']:>8}{entry['sum']:>10.3f}"
+                f"{entry['sum'] / entry['count']:>10.4f}{entry['max']:>10.3f}"
+            )
+        for entry in entries:
+            if entry['name'] == 'page_bytes':
+                lines.append(f"page bytes ({entry['labels']['source']}): {entry['count']} pages, "
+                             f"{entry['sum'] / entry['count']:.0f} mean, {entry['max']} max")
+            elif entry['name'] == 'page_ready_seconds':
+                lines.append(f"browser page ready ({entry['labels']['outcome']}): {entry['count']} pages, "
+                             f"{entry['sum'] / entry['count']:.2f}s mean, {entry['max']:.2f}s max")
+            elif entry['type'] == 'counter':
+                labels = ', '.join(f"{key}={value}" for key, value in entry['labels'].items())
+                lines.append(f"{entry['name']}{f' ({labels})' if labels else ''}: {entry['value']}")
+            elif entry['type'] == 'gauge':
+                lines.append(f"{entry['name']}: {entry['value']}")
+        return '\n'.join(lines)
+
+
+# Shared registry the scraper modules report to
+METRICS = Metrics()
+
+
+def _difference(after, before):
+    previous = {(entry['type'], entry['name'], tuple(sorted(entry['labels'].items()))): entry for entry in before}
+    changes = []
+    for entry in after:
+        old = previous.get((entry['type'], entry['name'], tuple(sorted(entry['labels'].items()))))
+        if old is None:
+            changes.append(entry)
+        elif entry['type'] == 'counter' and entry['value'] != old['value']:
+            changes.append({**entry, 'value': entry['value'] - old['value']})
+        elif entry['type'] == 'summary' and entry['count'] != old['count']:
+            changes.append({**entry, 'count': entry['count'] - old['count'], 'sum': entry['sum'] - old['sum']})
+        elif entry['type'] == 'gauge' and entry['value'] != old['value']:
+            changes.append(entry)
+    return changes
+
+
+def call_with_metrics(function, *args):
+    """Run function in a worker process; returns (result, metrics it recorded)
+
+    The metrics are a snapshot for METRICS.merge() in the parent. Only use
+    this in a process pool: in a thread the registry is shared, so the
+    difference would include other threads' work.
+    """
+    before = METRICS.snapshot()
+    result = function(*args)
+    return result, _difference(METRICS.snapshot(), before)
+
+
+def current_rss():
+    """Resident memory of this process in bytes"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    # Without psutil only the peak is available (KB on Linux, bytes on macOS)
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemorySampler:
+    """Sample this process's memory in the background and record the peak"""
+
+    def __init__(self, metrics=None, interval=0.1):
+        self.metrics = metrics or METRICS
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        while True:
+            self.metrics.peak('peak_rss_bytes', current_rss())
+            if self.stopped.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        self.metrics.peak('peak_rss_bytes', current_rss())
+
+
+@contextmanager
+def profiled(path, top=25):
+    """Run the block under cProfile, save the stats to path and print the top entries
+
+    cProfile only sees the calling thread; fetcher threads and parser
+    processes show up in the stage timers instead.
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        _save_profile(pstats.Stats(profiler), path, top)
+
+
+def _save_profile(stats, path, top):
+    stats.dump_stats(path)
+    print(f"\nProfile saved to {path} (top {top} by cumulative time):")
+    stats.sort_stats('cumulative').print_stats(top)
+
+
+class ThreadProfiles:
+    """Profile blocks on several threads and save their combined stats
+
+    A batch run's main thread only waits for its jobs, so each job's
+    thread is profiled instead and the profiles are added together.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profilers = []
+
+    @contextmanager
+    def profile(self):
+        """Profile the block on the current thread"""
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            enabled = True
+        except ValueError:
+            # Python 3.12+ allows one active profiler, and it already sees every thread
+            enabled = False
+        try:
+            yield
+        finally:
+            if enabled:
+                profiler.disable()
+                with self.lock:
+                    self.profilers.append(profiler)
+
+    def save(self, path, top=25):
+        import pstats
+
+        with self.lock:
+            profilers = list(self.profilers)
+        if not profilers:
+            print("\nNo profile recorded (no jobs ran)")
+            return
+        _save_profile(pstats.Stats(*profilers), path, top)
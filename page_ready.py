@@ -0,0 +1,49 @@
+"""Decide when a page loaded in Chrome is ready to read, instead of sleeping.
+
+A page counts as ready once the document has finished loading, the number
+of elements matching the selector we care about has stopped changing for a
+few polls, and a MutationObserver has seen no DOM changes for a short quiet
+period. The count may settle at zero (a filter page with no options for a
+query), so such pages are read once they are quiet instead of waiting out
+the timeout. Fast pages are read as soon as they settle; slow ones get up to
+the timeout.
+"""
+import time
+
+# Installed once per document; records when the DOM last changed
+OBSERVER_JS = """
+if (!window.__scraperMutations) {
+    window.__scraperMutations = {last: Date.now()};
+    new MutationObserver(function () { window.__scraperMutations.last = Date.now(); })
+        .observe(document.documentElement, {childList: true, subtree: true});
+}
+"""
+
+STATE_JS = """
+var mutations = window.__scraperMutations;
+return [
+    document.readyState,
+    document.querySelectorAll(arguments[0]).length,
+    mutations ? Date.now() - mutations.last : 0
+];
+"""
+
+
+def wait_until_stable(driver, selector, timeout=10, poll_interval=0.25, stable_polls=2, quiet_period=0.5):
+    """Wait for selector's match count to settle; returns (seconds, count, timed_out)"""
+    started = time.monotonic()
+    driver.execute_script(OBSERVER_JS)
+
+    last_count = None
+    stable = 0
+    while True:
+        ready_state, count, quiet_ms = driver.execute_script(STATE_JS, selector)
+        stable = stable + 1 if count == last_count else 0
+        last_count = count
+
+        elapsed = time.monotonic() - started
+        if ready_state == 'complete' and stable >= stable_polls and quiet_ms >= quiet_period * 1000:
+            return elapsed, count, False
+        if elapsed >= timeout:
+            return elapsed, count, True
+        time.sleep(poll_interval)
@@ -0,0 +1,298 @@
+"""Fetch -> parse -> sink pipeline for scraping many result pages.
+
+Fetcher threads push raw HTML onto a bounded queue, a process pool turns
+each page into item records, and the sink consumes the records on the
+calling thread, in job order. The bounded queues and the reorder window
+give back-pressure, so a slow stage throttles the ones before it instead
+of piling pages up in memory.
+"""
+import os
+import queue
+import threading
+import time
+
+from metrics import METRICS, call_with_metrics
+
+# Marks the end of a stage's output on a queue
+_DONE = object()
+
+
+def process_pool(max_workers):
+    """ProcessPoolExecutor whose workers are not forked from this process
+
+    By the time a pool starts, fetcher and metrics threads are running and may
+    hold locks such as METRICS.lock. A forked worker inherits such a lock
+    still held and deadlocks the first time it takes it, so workers come from
+    a forkserver (or are spawned where there is none) instead.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method))
+
+
+class StageStats:
+    """Counters for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    def record(self, seconds, error=False):
+        with self.lock:
+            self.processed += 1
+            self.busy_seconds += seconds
+            if error:
+                self.errors += 1
+
+    def snapshot(self, elapsed):
+        with self.lock:
+            return {
+                'processed': self.processed,
+                'errors': self.errors,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'per_second': round(self.processed / elapsed, 2) if elapsed else 0.0,
+            }
+
+
+class MonitoredQueue(queue.Queue):
+    """Bounded queue that remembers the deepest it has been"""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.max_depth = 0
+
+    def _put(self, item):
+        super()._put(item)
+        self.max_depth = max(self.max_depth, len(self.queue))
+
+
+class ScrapePipeline:
+    """Overlap page fetching with HTML parsing in worker processes
+
+    fetch(url) -> html runs on `fetch_workers` threads.
+    parse(html) -> records runs in a pool of `parse_workers` processes, so it
+    must be a picklable module-level function. With parse_workers=0 it runs
+    on a thread instead, which is cheaper for one-page runs.
+    sink(key, records) runs on the calling thread in job order: pages that
+    finish early wait until the ones before them have been sunk, so stopping
+    is deterministic. It can return False to stop the pipeline; no new
+    fetches start, and pages after the stopping one never reach the sink.
+    At most `reorder_window` jobs are out between the sink and the fetchers.
+    The first `lead_pages` jobs run on their own: later jobs start only once
+    those have been sunk, for runs that usually stop after the first page.
+    Pages that fail to fetch or parse reach the sink with records=None (an
+    empty list means the page parsed but had no items), and the errors are
+    counted in METRICS. Metrics recorded inside parser
+    processes are merged back into this process's METRICS.
+    Pass an existing executor to share one parser pool between pipelines.
+    """
+
+    def __init__(self, fetch, parse, sink, fetch_workers=4, parse_workers=None, queue_size=8, executor=None,
+                 reorder_window=None, lead_pages=0):
+        self.fetch = fetch
+        self.parse = parse
+        self.sink = sink
+        self.fetch_workers = fetch_workers
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self.executor = executor
+        self.raw_queue = MonitoredQueue(queue_size)
+        self.record_queue = MonitoredQueue(queue_size)
+        self.stages = {name: StageStats(name) for name in ('fetch', 'parse', 'sink')}
+        # Jobs handed out but not yet sunk; bounds the pages held back for ordering
+        self.reorder_window = reorder_window or fetch_workers + 2 * queue_size
+        self.window = threading.Semaphore(self.reorder_window)
+        self.lead_pages = lead_pages
+        self.lead_sunk = threading.Event()
+        if not lead_pages:
+            self.lead_sunk.set()
+        self.stopped = threading.Event()
+        self.started_at = None
+
+    def stop(self):
+        """Stop handing out new fetch jobs; work already in flight still drains"""
+        self.stopped.set()
+        # Fetchers waiting for the lead pages see the stop and exit
+        self.lead_sunk.set()
+
+    def stats(self):
+        """Return queue depths and per-stage throughput so far"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'queues': {
+                'raw_html': {'depth': self.raw_queue.qsize(), 'max_depth': self.raw_queue.max_depth},
+                'records': {'depth': self.record_queue.qsize(), 'max_depth': self.record_queue.max_depth},
+            },
+            'stages': {name: stage.snapshot(elapsed) for name, stage in self.stages.items()},
+        }
+
+    def run(self, jobs):
+        """Run (key, url) jobs through the pipeline and return the final stats"""
+        self.started_at = time.monotonic()
+        jobs = enumerate(jobs)
+        jobs_lock = threading.Lock()
+
+        fetchers = [
+            threading.Thread(target=self._fetch_loop, args=(jobs, jobs_lock), daemon=True)
+            for _ in range(self.fetch_workers)
+        ]
+        parser = threading.Thread(target=self._parse_loop, daemon=True)
+        for thread in fetchers:
+            thread.start()
+        parser.start()
+
+        # Tell the parse stage once every fetcher has finished
+        def close_raw_queue():
+            for thread in fetchers:
+                thread.join()
+            self.raw_queue.put(_DONE)
+        threading.Thread(target=close_raw_queue, daemon=True).start()
+
+        self._sink_loop()
+        parser.join()
+        return self.stats()
+
+    def _fetch_loop(self, jobs, jobs_lock):
+        while True:
+            # Wait until the sink has caught up enough for one more page
+            self.window.acquire()
+            if self.stopped.is_set():
+                self.window.release()
+                return
+            with jobs_lock:
+                job = next(jobs, None)
+            if job is None:
+                self.window.release()
+                return
+
+            sequence, (key, url) = job
+            if sequence >= self.lead_pages:
+                self.lead_sunk.wait()
+                if self.stopped.is_set():
+                    self.window.release()
+                    return
+            started = time.monotonic()
+            try:
+                html = self.fetch(url)
+                error = False
+            except Exception as e:
+                METRICS.error('fetch', e)
+                print(f"Error fetching {url}: {str(e)}")
+                html = None
+                error = True
+            self.stages['fetch'].record(time.monotonic() - started, error)
+            self.raw_queue.put((sequence, key, html))
+
+    def _parse_loop(self):
+        if self.executor is not None:
+            self._parse_in_pool(self.executor)
+        elif self.parse_workers:
+            with process_pool(self.parse_workers) as pool:
+                self._parse_in_pool(pool)
+        else:
+            while True:
+                entry = self.raw_queue.get()
+                if entry is _DONE:
+                    break
+                sequence, key, html = entry
+                if html is None:
+                    self.record_queue.put((sequence, key, None))
+                    continue
+                started = time.monotonic()
+                try:
+                    records = self.parse(html)
+                    error = False
+                except Exception as e:
+                    METRICS.error('parse', e)
+                    print(f"Error parsing page {key}: {str(e)}")
+                    records = None
+                    error = True
+                self.stages['parse'].record(time.monotonic() - started, error)
+                self.record_queue.put((sequence, key, records))
+
+        self.record_queue.put(_DONE)
+
+    def _parse_in_pool(self, pool):
+        # Bound the pages in flight so the pool cannot outrun the sink
+        max_in_flight = max(self.parse_workers, 1) * 2
+        in_flight = threading.Semaphore(max_in_flight)
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Thread pools share our METRICS, so only processes need to send theirs back
+        collect_metrics = isinstance(pool, ProcessPoolExecutor)
+        while True:
+            entry = self.raw_queue.get()
+            if entry is _DONE:
+                break
+            sequence, key, html = entry
+            if html is None:
+                self.record_queue.put((sequence, key, None))
+                continue
+            in_flight.acquire()
+            started = time.monotonic()
+            if collect_metrics:
+                future = pool.submit(call_with_metrics, self.parse, html)
+            else:
+                future = pool.submit(self.parse, html)
+            future.add_done_callback(
+                lambda f, sequence=sequence, key=key, started=started:
+                    self._parsed(sequence, key, f, started, in_flight, collect_metrics)
+            )
+        # Each page's callback releases its slot after queueing the records, so
+        # taking every slot back means all of our pages have reached the sink
+        # queue (the pool itself may be shared and busy with other pipelines)
+        for _ in range(max_in_flight):
+            in_flight.acquire()
+
+    def _parsed(self, sequence, key, future, started, in_flight, collect_metrics):
+        error = future.exception() is not None
+        records = None
+        if error:
+            METRICS.error('parse', future.exception())
+            print(f"Error parsing page {key}: {str(future.exception())}")
+        elif collect_metrics:
+            records, worker_metrics = future.result()
+            METRICS.merge(worker_metrics)
+        else:
+            records = future.result()
+        self.stages['parse'].record(time.monotonic() - started, error)
+        self.record_queue.put((sequence, key, records))
+        in_flight.release()
+
+    def _sink_loop(self):
+        # Pages that finished ahead of an earlier one wait here by sequence number
+        pending = {}
+        next_sequence = 0
+        while True:
+            entry = self.record_queue.get()
+            if entry is _DONE:
+                return
+            sequence, key, records = entry
+            pending[sequence] = (key, records)
+            while next_sequence in pending:
+                key, records = pending.pop(next_sequence)
+                next_sequence += 1
+                if not self.stopped.is_set():
+                    self._sink_page(key, records)
+                if next_sequence >= self.lead_pages:
+                    self.lead_sunk.set()
+                self.window.release()
+
+    def _sink_page(self, key, records):
+        started = time.monotonic()
+        try:
+            keep_going = self.sink(key, records)
+            error = False
+        except Exception as e:
+            METRICS.error('sink', e)
+            print(f"Error writing page {key}: {str(e)}")
+            keep_going = True
+            error = True
+        self.stages['sink'].record(time.monotonic() - started, error)
+        if keep_going is False:
+            self.stop()
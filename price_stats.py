@@ -0,0 +1,434 @@
+"""Streaming sold-price statistics per SKU.
+
+Prices are folded into running aggregates as items arrive, so nothing has
+to be rebuilt from raw rows. Each aggregate keeps:
+- count, mean, variance, min and max (RunningStats, Welford's method)
+- a t-digest sketch for median / p10 / p90 (TDigest)
+- the same two per sold day, for "last N days" windows (sales with no
+  sold date, or sold before the retention cutoff, only count all-time)
+
+Aggregates are keyed by (device type, storage, color, condition). Every
+item also updates the keys where any of storage / color / condition is
+None (meaning "any"), so a lookup like "128GB, any color, Pre-owned" is a
+single dict access. Items with a canonical product key (see product_key)
+are also aggregated per (device type, product key, condition), with the
+condition rolled up the same way. Everything serializes to JSON and merges, so results
+from separate runs or workers can be combined.
+
+Usage:
+    python price_stats.py price_stats.json.gz "iphone 14 pro" --storage 128GB --color Gray --days 7
+    python price_stats.py price_stats.json.gz iphone --product apple/iphone-14/pro/128gb
+"""
+import argparse
+import bisect
+import gzip
+import json
+import math
+import os
+import threading
+from datetime import date, timedelta
+from itertools import product
+
+
+class RunningStats:
+    """Count, mean, variance, min and max, updated one value at a time"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Fold another RunningStats into this one (Chan et al.)"""
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = data['count'], data['mean'], data['m2']
+        stats.min, stats.max = data['min'], data['max']
+        return stats
+
+
+class TDigest:
+    """Merging t-digest: approximate quantiles in bounded memory
+
+    Centroids near the tails are kept small and the ones in the middle
+    large, so extreme quantiles stay accurate. Size stays around
+    `compression` centroids no matter how many values are added.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.buffer = []
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value, weight=1.0):
+        self.buffer.append((value, weight))
+        self.total += weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.buffer) >= self.compression * 5:
+            self._compress()
+
+    def _k(self, q):
+        # k1 scale function: small centroids near q=0 and q=1
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        items = sorted(list(zip(self.means, self.weights)) + self.buffer)
+        self.buffer = []
+
+        means, weights = [], []
+        mean, weight = items[0]
+        so_far = 0.0
+        q_limit = self._k_inverse(self._k(0.0) + 1)
+        for next_mean, next_weight in items[1:]:
+            if (so_far + weight + next_weight) / self.total <= q_limit:
+                # Merge into the current centroid
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                so_far += weight
+                q_limit = self._k_inverse(min(self._k(so_far / self.total) + 1, self.compression / 4))
+                mean, weight = next_mean, next_weight
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def merge(self, other):
+        """Fold another digest into this one"""
+        other._compress()
+        for mean, weight in zip(other.means, other.weights):
+            self.buffer.append((mean, weight))
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Approximate value at quantile q (0..1), or None if empty"""
+        self._compress()
+        if not self.means:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+
+        target = q * self.total
+        # Cumulative weight at each centroid's center
+        centers = []
+        cumulative = 0.0
+        for weight in self.weights:
+            centers.append(cumulative + weight / 2)
+            cumulative += weight
+
+        if target <= centers[0]:
+            if centers[0] == 0:
+                return self.min
+            return self.min + (self.means[0] - self.min) * target / centers[0]
+        if target >= centers[-1]:
+            tail = self.total - centers[-1]
+            if tail == 0:
+                return self.max
+            return self.means[-1] + (self.max - self.means[-1]) * (target - centers[-1]) / tail
+
+        i = bisect.bisect_right(centers, target)
+        left, right = centers[i - 1], centers[i]
+        fraction = (target - left) / (right - left)
+        return self.means[i - 1] + (self.means[i] - self.means[i - 1]) * fraction
+
+    def to_dict(self):
+        self._compress()
+        return {
+            'compression': self.compression,
+            'means': self.means,
+            'weights': self.weights,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(data['compression'])
+        digest.means, digest.weights = list(data['means']), list(data['weights'])
+        digest.total = float(sum(digest.weights))
+        digest.min, digest.max = data['min'], data['max']
+        return digest
+
+
+class PriceAggregate:
+    """All-time and per-day price statistics for one key"""
+
+    def __init__(self, compression=100, retention_days=90):
+        self.compression = compression
+        self.retention_days = retention_days
+        self.stats = RunningStats()
+        self.digest = TDigest(compression)
+        self.days = {}
+
+    def add(self, price, sold_date=None):
+        self.stats.add(price)
+        self.digest.add(price)
+        if sold_date is None:
+            # An unknown day must not land in the "last N days" windows
+            return
+        day = sold_date.isoformat()
+        if day not in self.days:
+            self._expire()
+            if day < self._cutoff():
+                return
+            self.days[day] = (RunningStats(), TDigest(self.compression))
+        self.days[day][0].add(price)
+        self.days[day][1].add(price)
+
+    def _cutoff(self):
+        return (date.today() - timedelta(days=self.retention_days)).isoformat()
+
+    def _expire(self):
+        cutoff = self._cutoff()
+        for day in [day for day in self.days if day < cutoff]:
+            del self.days[day]
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.digest.merge(other.digest)
+        for day, (stats, digest) in other.days.items():
+            if day not in self.days:
+                self.days[day] = (RunningStats(), TDigest(self.compression))
+            self.days[day][0].merge(stats)
+            self.days[day][1].merge(digest)
+        self._expire()
+        return self
+
+    def window(self, days, today=None):
+        """Combined (RunningStats, TDigest) over the last `days` sold days"""
+        today = today or date.today()
+        start = (today - timedelta(days=days - 1)).isoformat()
+        end = today.isoformat()
+        stats, digest = RunningStats(), TDigest(self.compression)
+        for day, (day_stats, day_digest) in self.days.items():
+            if start <= day <= end:
+                stats.merge(day_stats)
+                digest.merge(day_digest)
+        return stats, digest
+
+    def summary(self, days=None, today=None):
+        """Count, mean, stddev, min/max and p10 / median / p90 prices"""
+        stats, digest = (self.stats, self.digest) if days is None else self.window(days, today)
+        return summarize(stats, digest)
+
+    def to_dict(self):
+        return {
+            'stats': self.stats.to_dict(),
+            'digest': self.digest.to_dict(),
+            'days': {day: [stats.to_dict(), digest.to_dict()] for day, (stats, digest) in self.days.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data, compression=100, retention_days=90):
+        aggregate = cls(compression, retention_days)
+        aggregate.stats = RunningStats.from_dict(data['stats'])
+        aggregate.digest = TDigest.from_dict(data['digest'])
+        aggregate.days = {
+            day: (RunningStats.from_dict(stats), TDigest.from_dict(digest))
+            for day, (stats, digest) in data['days'].items()
+        }
+        return aggregate
+
+
+def summarize(stats, digest):
+    if not stats.count:
+        return {'count': 0}
+    return {
+        'count': stats.count,
+        'mean': round(stats.mean, 2),
+        'stddev': round(stats.stddev, 2),
+        'min': round(stats.min, 2),
+        'max': round(stats.max, 2),
+        'p10': round(digest.quantile(0.1), 2),
+        'median': round(digest.quantile(0.5), 2),
+        'p90': round(digest.quantile(0.9), 2),
+    }
+
+
+def _clean(value):
+    """Attribute value as a key part; missing values (None / NaN / '') become ''"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return str(value)
+
+
+class PriceStatsStore:
+    """Price aggregates keyed by (device type, storage, color, condition) and by product key"""
+
+    KEY_FIELDS = ('storage', 'color', 'condition')
+
+    def __init__(self, compression=100, retention_days=90):
+        self.compression = compression
+        self.retention_days = retention_days
+        self.aggregates = {}
+        self.products = {}
+        self.lock = threading.Lock()
+
+    def _aggregate(self, key, aggregates=None):
+        aggregates = self.aggregates if aggregates is None else aggregates
+        if key not in aggregates:
+            aggregates[key] = PriceAggregate(self.compression, self.retention_days)
+        return aggregates[key]
+
+    def update(self, device_type, records):
+        """Fold scraped item records (dicts with price and attributes) into the aggregates"""
+        device_type = device_type.lower()
+        with self.lock:
+            for record in records:
+                price = record.get('price')
+                if price is None:
+                    continue
+                sold_date = record.get('sold_date')
+                if isinstance(sold_date, str):
+                    sold_date = date.fromisoformat(sold_date)
+                elif not isinstance(sold_date, date):
+                    sold_date = None
+
+                # The exact key plus every "any" rollup of it
+                parts = [(_clean(record.get(field)), None) for field in self.KEY_FIELDS]
+                for combination in product(*parts):
+                    self._aggregate((device_type, *combination)).add(price, sold_date)
+
+                product_key = _clean(record.get('product_key'))
+                if product_key:
+                    for condition in (_clean(record.get('condition')), None):
+                        self._aggregate((device_type, product_key, condition), self.products).add(price, sold_date)
+
+    def summary(self, device_type, storage=None, color=None, condition=None, days=None, today=None,
+                product_key=None):
+        """Statistics for one key; None in storage/color/condition means any value
+
+        With a product_key the product's aggregate (for the condition, or any
+        condition) is used and storage and color are ignored.
+        """
+        if product_key:
+            aggregates, key = self.products, (device_type.lower(), product_key, condition)
+        else:
+            aggregates, key = self.aggregates, (device_type.lower(), storage, color, condition)
+        with self.lock:
+            aggregate = aggregates.get(key)
+            if aggregate is None:
+                return {'count': 0}
+            return aggregate.summary(days, today)
+
+    def merge(self, other):
+        """Fold another store (e.g. from a separate worker) into this one"""
+        with self.lock:
+            for key, aggregate in other.aggregates.items():
+                self._aggregate(key).merge(aggregate)
+            for key, aggregate in other.products.items():
+                self._aggregate(key, self.products).merge(aggregate)
+        return self
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'compression': self.compression,
+                'retention_days': self.retention_days,
+                'aggregates': [[list(key), aggregate.to_dict()] for key, aggregate in self.aggregates.items()],
+                'products': [[list(key), aggregate.to_dict()] for key, aggregate in self.products.items()],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls(data['compression'], data['retention_days'])
+        for key, aggregate in data['aggregates']:
+            store.aggregates[tuple(key)] = PriceAggregate.from_dict(
+                aggregate, store.compression, store.retention_days
+            )
+        # Files saved before product keys existed have no product aggregates
+        for key, aggregate in data.get('products', []):
+            store.products[tuple(key)] = PriceAggregate.from_dict(
+                aggregate, store.compression, store.retention_days
+            )
+        return store
+
+    def save(self, path):
+        """Write the store as gzip-compressed JSON"""
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **defaults):
+        """Read a saved store, or start an empty one if the file does not exist"""
+        if not os.path.exists(path):
+            return cls(**defaults)
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query saved price statistics")
+    parser.add_argument('path', help="statistics file written with --price-stats")
+    parser.add_argument('device_type')
+    parser.add_argument('--storage', help="e.g. 128GB (default: any)")
+    parser.add_argument('--color', help="e.g. Gray (default: any)")
+    parser.add_argument('--condition', help="e.g. Pre-owned (default: any)")
+    parser.add_argument('--days', type=int, help="only items sold in the last DAYS days")
+    parser.add_argument('--product', metavar='KEY',
+                        help="canonical product key, e.g. apple/iphone-14/pro/128gb (replaces --storage and --color)")
+    args = parser.parse_args(argv)
+
+    store = PriceStatsStore.load(args.path)
+    summary = store.summary(args.device_type, args.storage, args.color, args.condition, args.days,
+                            product_key=args.product)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Map listing titles to a canonical product key.
+
+Runs after attribute extraction: the extracted model ("iPhone 14 Pro Max")
+is split into a model line and a variant ("iPhone 14" / "Pro Max"), the
+brand is read from the title or inferred from the model line, and the
+storage comes from the extracted attributes. The key joins the four parts,
+e.g. "apple/iphone-14/pro-max/128gb", so listings of the same product
+group together no matter how their titles are worded.
+
+Like listing_parser, this only needs the standard library.
+"""
+import math
+import re
+
+# Brand names as they appear in titles, and product lines that imply a brand
+BRANDS = {
+    'Apple': [r'apple', r'iphone', r'ipad', r'macbook', r'imac', r'airpods'],
+    'Samsung': [r'samsung', r'galaxy'],
+    'Google': [r'google', r'pixel'],
+    'Lenovo': [r'lenovo', r'thinkpad', r'ideapad'],
+    'Dell': [r'dell', r'xps', r'latitude', r'inspiron', r'alienware'],
+    'HP': [r'hp', r'hewlett[\s-]packard', r'elitebook', r'spectre'],
+    'Microsoft': [r'microsoft', r'surface'],
+    'Motorola': [r'motorola', r'moto\s+[gez]'],
+    'OnePlus': [r'one\s*plus'],
+    'Asus': [r'asus', r'zenbook', r'rog'],
+    'Acer': [r'acer', r'chromebook\s+spin'],
+    'Sony': [r'sony', r'xperia'],
+    'Canon': [r'canon'],
+    'Nikon': [r'nikon'],
+    'Fujifilm': [r'fuji(?:film)?'],
+    'GoPro': [r'gopro'],
+    'Garmin': [r'garmin'],
+}
+
+_BRAND_GROUPS = {f"b{number}": brand for number, brand in enumerate(BRANDS)}
+BRAND_RE = re.compile(
+    r'(?<![a-z0-9])(?:'
+    + '|'.join(f"(?P<{name}>{'|'.join(BRANDS[brand])})" for name, brand in _BRAND_GROUPS.items())
+    + r')(?![a-z])',
+    re.IGNORECASE,
+)
+
+# Trailing words that name a variant of a model line, with their spelling in keys
+VARIANTS = {
+    'pro max': 'Pro Max', 'pro xl': 'Pro XL', 'pro': 'Pro', 'plus': 'Plus', '+': 'Plus', 'max': 'Max',
+    'mini': 'Mini', 'ultra': 'Ultra', 'fe': 'FE', 'xl': 'XL', 'air': 'Air',
+}
+VARIANT_RE = re.compile(
+    r'^(?P<model>.+?)\s*(?P<variant>\+|\b(?:Pro\s+Max|Pro\s+XL|Pro|Plus|Max|Mini|Ultra|FE|XL|Air))$',
+    re.IGNORECASE,
+)
+
+_KEY_PART_RE = re.compile(r'[^a-z0-9.+]+')
+
+
+def _text(value):
+    """Attribute value as text; missing values (None / NaN) become ''"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return str(value).strip()
+
+
+def find_brand(*texts):
+    """Brand of the first text that names one (or one of its product lines)"""
+    for text in texts:
+        if text:
+            brand_match = BRAND_RE.search(text)
+            if brand_match:
+                return _BRAND_GROUPS[brand_match.lastgroup]
+    return None
+
+
+def split_model(model):
+    """Split 'iPhone 14 Pro Max' into ('iPhone 14', 'Pro Max')"""
+    model = ' '.join(model.split())
+    variant_match = VARIANT_RE.match(model)
+    if not variant_match:
+        return model, ''
+    variant = ' '.join(variant_match.group('variant').lower().split())
+    return variant_match.group('model'), VARIANTS[variant]
+
+
+def canonical_product(title, attributes):
+    """Brand, model line, variant and storage of a listing
+
+    attributes are the extracted ones (see attribute_extractor); without
+    a model there is no product to name, so None is returned.
+    """
+    model = _text(attributes.get('model'))
+    if not model:
+        return None
+    model_line, variant = split_model(model)
+    return {
+        'brand': find_brand(model, title) or '',
+        'model': model_line,
+        'variant': variant,
+        'storage': _text(attributes.get('storage')),
+    }
+
+
+def _key_part(text):
+    return _KEY_PART_RE.sub('-', text.lower()).strip('-')
+
+
+def product_key(title, attributes):
+    """Canonical key such as 'apple/iphone-14/pro-max/128gb', or None if the model is unknown"""
+    product = canonical_product(title, attributes)
+    if product is None:
+        return None
+    return '/'.join(_key_part(product[part]) for part in ('brand', 'model', 'variant', 'storage'))
+
+
+def product_keys(df, title_column='name'):
+    """product_key for every row of a DataFrame of records, e.g. an older CSV
+
+    Uses the model and storage columns when present and extracts them from
+    the titles otherwise. Each distinct combination is keyed once.
+    """
+    import pandas as pd
+
+    if 'model' in df.columns and 'storage' in df.columns:
+        attributes = df[['model', 'storage']]
+    else:
+        import attribute_extractor
+        attributes = attribute_extractor.for_device().extract_series(df[title_column])[['model', 'storage']]
+
+    rows = attributes.assign(title=df[title_column]).astype(object)
+    rows = rows.where(rows.notna(), None)
+    keys = {}
+    values = []
+    for title, model, storage in zip(rows['title'], rows['model'], rows['storage']):
+        if (title, model, storage) not in keys:
+            keys[(title, model, storage)] = product_key(title, {'model': model, 'storage': storage})
+        values.append(keys[(title, model, storage)])
+    return pd.Series(values, index=df.index, name='product_key', dtype=object)
@@ -0,0 +1,183 @@
+"""On-disk cache of fetched pages.
+
+Pages are stored gzip-compressed under a key derived from the normalized
+URL, with a small SQLite index that tracks expiry, size and last access
+for TTL checks and least-recently-used eviction.
+"""
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from fetchers import looks_blocked
+
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'responses')
+
+# Sold listings change as new sales come in; filter options hardly ever do
+SOLD_PAGE_TTL = 15 * 60
+FILTER_PAGE_TTL = 7 * 24 * 60 * 60
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a page is not in the cache"""
+
+
+def normalize_url(url):
+    """Return url with a lowercase host and sorted query parameters"""
+    parts = urlsplit(url)
+    query = sorted(parse_qsl(parts.query, keep_blank_values=False))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+
+def cache_key(url):
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+def ttl_for(url):
+    """Pick a TTL for url: short for sold-listing searches, long for filter pages"""
+    params = dict(parse_qsl(urlsplit(url).query))
+    if params.get('LH_Sold') == '1':
+        return SOLD_PAGE_TTL
+    return FILTER_PAGE_TTL
+
+
+class ResponseCache:
+    """Size-bounded on-disk page cache with per-entry TTLs"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self.db.commit()
+
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.html.gz")
+
+    def get(self, url, allow_expired=False):
+        """Return the cached HTML for url, or None if missing or expired"""
+        key = cache_key(url)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT expires_at FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+            if row[0] < now and not allow_expired:
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                return None
+            try:
+                with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+                    html = f.read()
+            except OSError:
+                # Index entry without a body, e.g. the file was deleted by hand
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.db.commit()
+                self.counters['misses'] += 1
+                return None
+            self.db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (now, key))
+            self.db.commit()
+            self.counters['hits'] += 1
+            return html
+
+    def put(self, url, html, ttl=None):
+        """Store html for url, then evict old entries if over the size limit"""
+        key = cache_key(url)
+        path = self._path(key)
+        ttl = ttl_for(url) if ttl is None else ttl
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file first so readers never see a half-written page
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO entries (key, url, size, stored_at, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, normalize_url(url), size, now, now + ttl, now),
+            )
+            self.counters['stores'] += 1
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute('SELECT key, size FROM entries ORDER BY last_access').fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+            self.counters['evictions'] += 1
+
+    def stats(self):
+        """Return hit/miss counters along with the current entry count and size"""
+        with self.lock:
+            entries, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+            return {**self.counters, 'entries': entries, 'bytes': size}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class CachingFetcher:
+    """Serve pages from a ResponseCache and fill it from another fetcher
+
+    In replay mode only the cache is used, expired entries included, and a
+    page that was never cached raises CacheMiss instead of being fetched.
+    """
+
+    def __init__(self, fetcher, cache, replay=False):
+        self.fetcher = fetcher
+        self.cache = cache
+        self.replay = replay
+
+    def fetch(self, url, wait_for=None, **browser_options):
+        html = self.cache.get(url, allow_expired=self.replay)
+        if html is not None:
+            return html
+        if self.replay:
+            raise CacheMiss(url)
+
+        html = self.fetcher.fetch(url, wait_for=wait_for, **browser_options)
+        # Never cache a challenge page, or we would keep serving it
+        if not looks_blocked(html):
+            self.cache.put(url, html)
+        return html
+
+    def close(self):
+        if self.fetcher is not None:
+            self.fetcher.close()
+        self.cache.close()
@@ -0,0 +1,227 @@
+"""Columnar store for scraped results.
+
+Each save becomes one Parquet file under
+    <root>/device_type=<device>/date=<YYYY-MM-DD>/part-<time>-<id>.parquet
+and is listed in <root>/manifest.json together with its row count and
+price / sold-date ranges. Loading reads the manifest instead of globbing
+directories, skips files whose ranges cannot match the query, and pushes
+the remaining predicates down into the Parquet scan.
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DEFAULT_STORE_DIR = 'results'
+MANIFEST_NAME = 'manifest.json'
+
+# Low-cardinality attributes are dictionary encoded (categoricals in pandas)
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema([
+    ('name', pa.string()),
+    ('price', pa.float64()),
+    ('item_id', pa.string()),
+    ('sold_date', pa.date32()),
+    ('shipping', pa.float64()),
+    ('url', pa.string()),
+    ('storage', CATEGORY),
+    ('color', CATEGORY),
+    ('condition', CATEGORY),
+    ('model', CATEGORY),
+    # Device-specific attributes (see attribute_extractor.DEVICE_CATEGORIES)
+    ('processor', CATEGORY),
+    ('ram', CATEGORY),
+    ('type', CATEGORY),
+    ('resolution', CATEGORY),
+    ('product_key', CATEGORY),
+    ('cluster_id', pa.int64()),
+    ('scraped_at', pa.timestamp('s')),
+])
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def to_table(df, scraped_at=None):
+    """Convert scraped rows to an Arrow table with the store's schema"""
+    scraped_at = scraped_at or datetime.now().replace(microsecond=0)
+    columns = {}
+    for field in SCHEMA:
+        if field.name == 'scraped_at':
+            values = pd.Series([scraped_at] * len(df), dtype='datetime64[s]')
+        elif field.name in df.columns:
+            values = df[field.name]
+            if field.name == 'sold_date':
+                values = pd.to_datetime(values, errors='coerce').dt.date
+        else:
+            values = pd.Series([None] * len(df), dtype=object)
+
+        present = values.notna()
+        if field.type in (CATEGORY, pa.string()):
+            # CSVs read back with pandas give numeric-looking columns (item_id) as
+            # numbers, and as floats once a value is missing
+            if pd.api.types.is_float_dtype(values) and (values[present] % 1 == 0).all():
+                values = values.astype('Int64')
+            values = values.astype(str).where(present, None)
+            array = pa.array(values, type=pa.string())
+            if field.type == CATEGORY:
+                array = array.dictionary_encode()
+        else:
+            array = pa.array(values.astype(object).where(present, None), type=field.type)
+        columns[field.name] = array
+    return pa.table(columns, schema=SCHEMA)
+
+
+class ResultsStore:
+    """Parquet results partitioned by device type and date, with a manifest"""
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def manifest(self):
+        """Return the list of file entries in the manifest"""
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)['files']
+        except FileNotFoundError:
+            return []
+
+    def _write_manifest(self, files):
+        # Replace atomically so readers never see a partial manifest
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': files}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def write(self, df, device_type):
+        """Save a DataFrame of scraped items as a new partition file"""
+        if len(df) == 0:
+            return None
+
+        scraped_at = datetime.now().replace(microsecond=0)
+        table = to_table(df, scraped_at)
+        partition = os.path.join(f"device_type={device_type}", f"date={scraped_at.date().isoformat()}")
+        filename = f"part-{scraped_at.strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        relative_path = os.path.join(partition, filename)
+
+        os.makedirs(os.path.join(self.root, partition), exist_ok=True)
+        pq.write_table(table, os.path.join(self.root, relative_path), compression='zstd')
+
+        sold_dates = table['sold_date']
+        min_sold, max_sold = pc.min(sold_dates).as_py(), pc.max(sold_dates).as_py()
+        entry = {
+            'path': relative_path,
+            'device_type': device_type,
+            'date': scraped_at.date().isoformat(),
+            'written_at': scraped_at.isoformat(),
+            'rows': table.num_rows,
+            'min_price': pc.min(table['price']).as_py(),
+            'max_price': pc.max(table['price']).as_py(),
+            'min_sold_date': min_sold.isoformat() if min_sold else None,
+            'max_sold_date': max_sold.isoformat() if max_sold else None,
+        }
+        with self.lock:
+            self._write_manifest(self.manifest() + [entry])
+
+        print(f"\nDetailed results have been saved to {os.path.join(self.root, relative_path)}")
+        return entry
+
+    def files(self, device_type, min_price=None, max_price=None, start_date=None, end_date=None):
+        """Manifest entries for device_type whose ranges can match the predicates"""
+        start_date, end_date = _as_date(start_date), _as_date(end_date)
+        selected = []
+        for entry in self.manifest():
+            if entry['device_type'] != device_type:
+                continue
+            if min_price is not None and entry['max_price'] is not None and entry['max_price'] < min_price:
+                continue
+            if max_price is not None and entry['min_price'] is not None and entry['min_price'] > max_price:
+                continue
+            if start_date and (not entry['max_sold_date'] or _as_date(entry['max_sold_date']) < start_date):
+                continue
+            if end_date and (not entry['min_sold_date'] or _as_date(entry['min_sold_date']) > end_date):
+                continue
+            selected.append(entry)
+        return selected
+
+    def _scanner(self, device_type, columns=None, min_price=None, max_price=None, conditions=None,
+                 start_date=None, end_date=None, batch_size=None):
+        entries = self.files(device_type, min_price, max_price, start_date, end_date)
+        if not entries:
+            return None
+
+        start_date, end_date = _as_date(start_date), _as_date(end_date)
+        predicates = []
+        if min_price is not None:
+            predicates.append(pc.field('price') >= min_price)
+        if max_price is not None:
+            predicates.append(pc.field('price') <= max_price)
+        if conditions:
+            predicates.append(pc.field('condition').cast(pa.string()).isin(list(conditions)))
+        if start_date:
+            predicates.append(pc.field('sold_date') >= pa.scalar(start_date, pa.date32()))
+        if end_date:
+            predicates.append(pc.field('sold_date') <= pa.scalar(end_date, pa.date32()))
+
+        expression = None
+        for predicate in predicates:
+            expression = predicate if expression is None else expression & predicate
+
+        dataset = ds.dataset(
+            [os.path.join(self.root, entry['path']) for entry in entries],
+            schema=SCHEMA,
+            format='parquet',
+        )
+        options = {'columns': columns, 'filter': expression}
+        if batch_size:
+            options['batch_size'] = batch_size
+        return dataset.scanner(**options)
+
+    def load(self, device_type, columns=None, min_price=None, max_price=None, conditions=None,
+             start_date=None, end_date=None):
+        """Load matching rows into one DataFrame
+
+        columns limits which columns are read. Price bounds are inclusive,
+        conditions is a list of condition names, and the date window applies
+        to each listing's sold date.
+        """
+        scanner = self._scanner(device_type, columns, min_price, max_price, conditions, start_date, end_date)
+        if scanner is None:
+            return pd.DataFrame(columns=columns or SCHEMA.names)
+        return scanner.to_table().to_pandas()
+
+    def iter_batches(self, device_type, columns=None, batch_size=65536, min_price=None, max_price=None,
+                     conditions=None, start_date=None, end_date=None):
+        """Yield matching rows as DataFrames of at most batch_size rows"""
+        scanner = self._scanner(device_type, columns, min_price, max_price, conditions, start_date, end_date,
+                                batch_size=batch_size)
+        if scanner is None:
+            return
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+    def load_recent(self, device_type):
+        """Load the most recently written file for device_type"""
+        entries = [entry for entry in self.manifest() if entry['device_type'] == device_type]
+        if not entries:
+            return None
+        # The manifest is append-only, so the last entry is the newest
+        latest = entries[-1]
+        return pq.read_table(os.path.join(self.root, latest['path'])).to_pandas()
@@ -0,0 +1,69 @@
+"""Build eBay sold-listing search URLs.
+
+Imports nothing outside the standard library, so scripts and worker
+processes can build URLs without loading the scraper's HTTP, browser or
+pandas dependencies (see also listing_parser and attribute_extractor).
+"""
+
+DEFAULT_BASE_URL = "https://www.ebay.com"
+
+# Largest page size eBay's search supports
+ITEMS_PER_PAGE = 240
+
+# _sop value that lists the most recently ended (sold) items first
+SORT_RECENTLY_ENDED = 13
+
+
+def build_search_url(device_type, filters, page=None, per_page=None, sort=None, base_url=DEFAULT_BASE_URL):
+    """Build eBay search URL with filters, optionally for a given results page"""
+    # Construct the base search query
+    search_terms = [device_type]
+    
+    # Add non-condition filter values to search terms
+    for filter_type, values in filters.items():
+        if filter_type != 'condition' and values:
+            if isinstance(values, list):
+                search_terms.extend(values)
+            else:
+                search_terms.append(values)
+    
+    # Join all search terms
+    search_query = " ".join(search_terms).replace(" ", "+")
+    
+    # Build the URL with proper eBay parameters
+    url = f"{base_url}/sch/i.html"
+    url += f"?_nkw={search_query}"
+    url += "&LH_Sold=1"  # Show sold items
+    url += "&LH_Complete=1"  # Show completed items
+    url += "&rt=nc"  # No category constraints
+    
+    # Add condition parameters if present
+    if 'condition' in filters and filters['condition']:
+        condition_params = []
+        for condition in filters['condition']:
+            if condition == 'New':
+                condition_params.append("1000")
+            elif condition == 'Open Box':
+                condition_params.append("1500")
+            elif condition == 'Certified Refurbished':
+                condition_params.append("2000")
+            elif condition == 'Seller Refurbished':
+                condition_params.append("2500")
+            elif condition == 'Pre-owned':
+                condition_params.append("3000")
+            elif condition == 'For Parts or Not Working':
+                condition_params.append("7000")
+        
+        if condition_params:
+            url += f"&LH_ItemCondition={'|'.join(condition_params)}"
+    
+    if sort:
+        url += f"&_sop={sort}"  # Sort order
+    
+    # Pagination
+    if per_page:
+        url += f"&_ipg={per_page}"  # Items per page
+    if page:
+        url += f"&_pgn={page}"  # Page number
+    
+    return url